@@ -6,18 +6,18 @@ import os
 import codecs
 
 import exceptions
-from ui import FxGpioUI
 from threads import ThreadBase, FxQueueItem
 from threads.gpio import GPIThread, GPOThread
 from threads.http import HTTPClientThread, HTTPServerThread
 from threads.livewire import LivewireThread
-
-import PySimpleGUI as sg
+from threads.metrics import MetricsExporter
 
 from helpers import Map, multi_getattr
 from helpers.enum import ModuleStatus
+from helpers.status import StatusStore
+from helpers.latency import LatencyRecorder
 from helpers.app import ModuleIterator, terminate_process
-from action import Action
+from action import Action, ActionRegistry
 
 class FxGpioApp(ThreadBase):
 
@@ -35,26 +35,46 @@ class FxGpioApp(ThreadBase):
 
     # SubThreads
     subthread: Map = None
-    module_status: dict = None
+    module_status: StatusStore = None
+
+    # Trigger to output latency histograms
+    latency: LatencyRecorder = None
+    latency_report_interval: float = 300 # sec, 0 disables the log report
 
-    # ActionsList
-    actions: list = None
+    # Prometheus endpoint, None unless enabled
+    metrics: MetricsExporter = None
+
+    # Action registry
+    actions: ActionRegistry = None
 
     UI = None
 
     initialized = False
 
-    last_tick = None
-    tps = None
-
     is_mainthread = True
 
-    queue_blocking: bool = False
-    queue_rate: int = 0
-    queue_cooldown: float = 0
+    # Run as a service, PySimpleGUI is never imported
+    headless: bool = False
+
+    # Runs main_loop() while the main thread runs the UI, None when headless
+    dispatch_thread: threading.Thread = None
 
     config_file = './config.json'
     config = {
+        'System': {
+            'Latency': {
+                'Enabled': True,
+                'ReportInterval': 300,
+            },
+            'Metrics': {
+                'Enabled': False,
+                'Listen': '127.0.0.1',
+                'Port': 9390,
+                'AllowedIP': [
+                    '127.0.0.0/8',
+                ],
+            },
+        },
         'Interface': {
             'Theme': 'SystemDefault',
             'Buttons': {
@@ -91,8 +111,20 @@ class FxGpioApp(ThreadBase):
             'HTTPClient': {
                 'Enabled': True,
             },
+            'HTTPServer': {
+                'Enabled': False,
+                'Listen': '0.0.0.0',
+                'Port': 9380,
+                'AllowedIP': [
+                    '127.0.0.0/8',
+                ],
+                'Routes': [],
+            },
             'Livewire': {
                 'Enabled': True,
+                'Nodes': [],
+                'InputCommands': [],
+                'OutputCommands': [],
             },
         }
     }
@@ -105,32 +137,36 @@ class FxGpioApp(ThreadBase):
         ('Livewire', LivewireThread),
     )
 
-    def __init__(self, run_dir, *args, **kwargs):
+    def __init__(self, run_dir, *args, headless=False, **kwargs):
         super(FxGpioApp, self).__init__(*args, **kwargs)
 
         self.run_dir = run_dir
+        self.headless = headless
+
         self.init_properties()
 
         logging.debug(f'Initializing main app...')
 
-        sg.popup_quick_message(f'Initializing {self.appname}...', background_color='black', text_color='white', auto_close=True, non_blocking=True)
         self.init_app()
         self.initialized = True
 
     def init_properties(self):
         self.restart = False
         self.subthread = Map({})
-        self.actions = []
-        self.module_status = {}
+        self.actions = ActionRegistry()
+        self.module_status = StatusStore()
 
     def init_app(self):
         init_sequence = (
             { 'method': 'init_settings' },
             { 'method': 'init_ui' },
             { 'method': 'init_config' },
+            { 'method': 'init_latency' },
             { 'method': 'UI.post_init' },
             { 'method': 'init_subthreads' },
             { 'method': 'init_actions' },
+            { 'method': 'init_action_refs' },
+            { 'method': 'init_metrics' },
         )
 
         for init_ptr in init_sequence:
@@ -139,7 +175,7 @@ class FxGpioApp(ThreadBase):
                 init(*init_ptr.get('args', ()), **init_ptr.get('kwargs', {}))
             except exceptions.FxBaseException as e:
                 logging.error(e.get_caught_str())
-                if type(self.UI) is FxGpioUI and self.UI.simple_init:
+                if self.UI is not None and self.UI.simple_init:
                     self.UI.show_error(
                         f'{self.appname} failed to initialize.', 
                         e.get_alert_str(),
@@ -156,7 +192,13 @@ class FxGpioApp(ThreadBase):
 
     def init_ui(self):
         logging.debug('Initializing user interface...')
-        self.UI = FxGpioUI(self)
+
+        if self.headless:
+            from ui.headless import HeadlessUI
+            self.UI = HeadlessUI(self)
+        else:
+            from ui.gui import FxGpioUI
+            self.UI = FxGpioUI(self)
 
     def init_config(self):
         logging.debug('Initializing configuration...')
@@ -173,6 +215,12 @@ class FxGpioApp(ThreadBase):
             logging.debug(f'Loading configuration from "{self.config_file}"...')
             self.load_config_file()
         
+    def init_latency(self):
+        config = self.config.get('System', {}).get('Latency', {})
+
+        self.latency = LatencyRecorder(enabled=config.get('Enabled', True) is True)
+        self.latency_report_interval = float(config.get('ReportInterval', self.latency_report_interval))
+
     def save_config_file(self):
         logging.debug('Saving current configuration to file')
         with codecs.open(self.config_file, 'w', 'utf-8') as f:
@@ -194,7 +242,28 @@ class FxGpioApp(ThreadBase):
         actions = self.config.get('Actions', [])
 
         for action in actions:
-            self.actions.append(Action(self, action))
+            self.actions.add(Action(self, action))
+
+    def init_action_refs(self):
+        logging.debug('Resolving module action references...')
+
+        errors = []
+        for module in self.subthread.values():
+            try:
+                module.resolve_actions(self.actions)
+            except exceptions.FxConfigException as e:
+                logging.error(e)
+                errors.append(e.msg)
+
+        if len(errors) > 0:
+            raise exceptions.FxConfigException('\n'.join(errors))
+
+    def init_metrics(self):
+        config = self.config.get('System', {}).get('Metrics', {})
+        if config.get('Enabled', False) is not True:
+            return
+
+        self.metrics = MetricsExporter(self, config)
 
     def init_subthreads(self):
         logging.debug('Initializing subthreads...')
@@ -218,44 +287,77 @@ class FxGpioApp(ThreadBase):
     def pre_start(self):
         logging.info(f'Starting {self.appname} v{self.version}...')
         self.start_subthreads()
-        self.UI.app_start()
 
-    def tick(self):
-        self.UI.ui_tick()
+        if self.metrics is not None:
+            self.metrics.start()
 
-        cur_time = time.time_ns() // 1000000
-        if self.last_tick is not None:
-            self.tps = 1000 / (cur_time-self.last_tick)
+        if self.latency.enabled and self.latency_report_interval > 0:
+            self.scheduler.call_later(self.latency_report_interval, self.report_latency)
 
-        self.last_tick = cur_time
-        # print(self.tps)
+        if self.headless:
+            self.UI.app_start()
 
     def run(self):
         if not self.initialized:
             return 1
 
-        super(FxGpioApp, self).main_loop()
+        if self.headless:
+            super(FxGpioApp, self).main_loop()
+        else:
+            # Tk must stay on the main thread, work dispatch gets a thread of its own
+            self.dispatch_thread = threading.Thread(target=self.main_loop, name='DispatchThread', daemon=True)
+            self.dispatch_thread.start()
+            self.UI.run()
+
         return self.post_shutdown()
 
-    def run_action(self, action_name):
-        for action in self.actions:
-            if action.name == action_name:
-                return action.run()
+    def run_action(self, action, trace=None):
+        if type(action) is not Action:
+            action_name = action
+            action = self.actions.get(action_name)
+            if action is None:
+                logging.error(f'Cannot run unknown action "{action_name}"')
+                return False
+
+        return action.run(trace)
 
     def run_action_later(self, *args, **kwargs):
-        return self.run_later('run_action').with_args(*args, **kwargs)
+        return self.run_later(self.run_action).with_args(*args, **kwargs)
+
+    def run_actions(self, actions, trace=None):
+        if trace is None:
+            return [ self.run_action(action) for action in actions ]
+
+        trace.dispatched = time.monotonic()
+        return [ self.run_action(action, trace) for action in actions ]
+
+    def run_actions_later(self, actions, trace=None):
+        # One queue item for a whole batch of triggers
+        return self.run_later(self.run_actions).with_args(actions, trace=trace)
+
+    def report_latency(self):
+        summary = self.latency.summary()
+
+        if len(summary['action']) > 0:
+            logging.info('Trigger to output latency (p50/p99/max ms): ' + ', '.join(
+                f'{name} {s["p50"] * 1000:.1f}/{s["p99"] * 1000:.1f}/{s["max"] * 1000:.1f} ({s["count"]})' for name, s in summary['action'].items()
+            ))
+
+            logging.info('Latency by stage (p99 ms): ' + ', '.join(
+                f'{name} {s["p99"] * 1000:.1f}' for name, s in summary['stage'].items()
+            ) + (f', {summary["failed"]} failed send(s) excluded' if summary['failed'] > 0 else ''))
+
+        self.scheduler.call_later(self.latency_report_interval, self.report_latency)
 
     def update_module_status(self, module, status, update_if=None):
-        prev_status = self.module_status.get(module.module_id, None)
-        if update_if is not None:
-            if not update_if == prev_status:
-                return False
+        # Atomic, update_if is compared and replaced under the store's lock
+        if self.module_status.transition(module.module_id, status, expected=update_if) is None:
+            return False
 
-        self.module_status[module.module_id] = status
         return status
 
     def update_module_status_later(self, *args, **kwargs):
-        return self.run_later('update_module_status').with_args(*args, **kwargs)
+        return self.run_later(self.update_module_status).with_args(*args, **kwargs)
 
     def shutdown(self, by_exception=False):
         if self.exit:
@@ -264,15 +366,33 @@ class FxGpioApp(ThreadBase):
         logging.warning(f'{self.appname} shutting down!')
         
         self.shutdown_subthreads()
-        self.UI.shutdown()
+
+        if self.metrics is not None:
+            self.metrics.shutdown()
+
+        if self.headless or by_exception:
+            # Headless or interrupted on the main thread, nothing else runs the UI
+            self.UI.shutdown()
+        else:
+            self.UI.run_later('shutdown').run()
+
         self.exit = True
 
         if by_exception:
+            self.interrupt_dispatch()
             return self.post_shutdown()
 
+    def interrupt_dispatch(self):
+        # Wake the dispatch thread from an empty queue so it sees the exit flag
+        if self.dispatch_thread is not None and self.dispatch_thread is not threading.current_thread():
+            self.queue.put(FxQueueItem(self, 'tick'))
+
     def post_shutdown(self):
         logging.debug('Waiting for all threads to shutdown...')
 
+        if self.dispatch_thread is not None:
+            self.dispatch_thread.join(10)
+
         for module in self.subthread.values():
             module.join(10)
 
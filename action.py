@@ -3,15 +3,82 @@ import time
 
 import exceptions
 from helpers.enum import ActionSequenceItemType
+from threads import when_all
+
+class ActionRegistry():
+
+    # Action name -> Action
+    by_name: dict = None
+
+    # Main window button key -> Action
+    by_key: dict = None
+
+    # Button text -> Action
+    by_text: dict = None
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_key = {}
+        self.by_text = {}
+
+    def __iter__(self):
+        return iter(self.by_name.values())
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def add(self, action):
+        if action.name in self.by_name:
+            raise exceptions.FxConfigException(f'Action "{action.name}" is defined more than once.', fatal=True)
+
+        self.by_name[action.name] = action
+        self.by_key[action.key] = action
+        if action.text is not None:
+            self.by_text.setdefault(action.text, action)
+
+        return action
+
+    def get(self, name, default=None):
+        return self.by_name.get(name, default)
+
+    def get_by_key(self, key, default=None):
+        return self.by_key.get(key, default)
+
+    def get_by_text(self, text, default=None):
+        return self.by_text.get(text, default)
+
+    def resolve(self, names):
+        """
+        Resolve a list of action names to Action objects, returns the
+        resolved actions and the names that did not match any action.
+
+        """
+        resolved = []
+        unknown = []
+        for name in names:
+            action = self.by_name.get(name, None)
+            if action is None:
+                unknown.append(name)
+            else:
+                resolved.append(action)
+
+        return tuple(resolved), unknown
+
 
 class Action():
 
     name: str = None
     text: str = None
+    key: str = None
     sequence = None
 
     app = None
 
+    button_key_prefix: str = 'action_btn'
+
     def __str__(self):
         return f'<Action {self.name} seq={self.sequence}>'
 
@@ -24,16 +91,43 @@ class Action():
             raise exceptions.FxConfigException('Action requires a "Name" property.', fatal=True)
 
         self.text = action_dict.get('Text', None)
+        self.key = self.button_key(self.name)
         self.sequence = ActionSequence(self, action_dict.get('Sequence', []))
 
-    def run(self):
+    @classmethod
+    def button_key(cls, name):
+        return f'{cls.button_key_prefix}.{name}'
+
+    def run(self, trace=None):
+        """
+        Dispatch the action's sequence and return the handles of its output
+        commands, the outcome is reported once all of them have settled.
+        Given a LatencyTrace, every output command is timed against it.
+
+        """
         logging.info(f'Running action {self}...')
-        if self.sequence.pre_run() is not False:
-            self.app.UI.ui_action_ran(self)
-            self.sequence.run()
-            self.app.UI.notify(f'Action "{self.name}" with {self.sequence.length()} sequence items ran successfully!')
-        else:
+        if self.sequence.pre_run() is False:
             logging.error(f'Cannot run action {self}!')
+            return False
+
+        self.app.UI.run_later('ui_action_ran').with_args(self)
+        handles = self.sequence.run(trace)
+        when_all(handles, self.app.run_later(self.sequence_done).with_args)
+
+        return handles
+
+    def sequence_done(self, handles):
+        failed = 0
+        for handle in handles:
+            if handle.exception() is not None or handle.result() is False:
+                failed += 1
+
+        if failed > 0:
+            logging.error(f'Action "{self.name}" finished with {failed} of {len(handles)} output command(s) failed!')
+            return False
+
+        self.app.UI.run_later('notify').with_args(f'Action "{self.name}" with {self.sequence.length()} sequence items ran successfully!')
+        return True
 
 
 class ActionSequence():
@@ -60,10 +154,16 @@ class ActionSequence():
             if sequence_item.pre_run() is False:
                 return False
 
-    def run(self):
+    def run(self, trace=None):
         logging.debug(f'Action sequence of action "{self.action}" running {self.length()} tasks.')
+
+        # Lay the items out on a timeline, Wait items only push later items back
+        handles = []
+        at = time.monotonic()
         for sequence_item in self.sequence_list:
-            sequence_item.run()
+            at = sequence_item.run(at, handles, trace)
+
+        return handles
 
 
 class ActionSequenceItem():
@@ -128,7 +228,7 @@ class ActionSequenceItem():
     def pre_run(self):
         if self.item_type == ActionSequenceItemType.RunOutputCommand:
             if not self.module.initialized:
-                self.action_sequence.action.app.UI.show_error(
+                self.action_sequence.action.app.UI.run_later('show_error').with_args(
                     f'Error while preparing to run action "{self.action_sequence.action.name}":', 
                     f'Output command "{self.command}" failed to run because module {self.module.name} is not initialized!'
                 )
@@ -136,21 +236,23 @@ class ActionSequenceItem():
 
         return True
 
-    def run(self):
-        if self.item_type == ActionSequenceItemType.NoOp:
-            return True
+    def run(self, at, handles, trace=None):
+        """
+        Dispatch this item to run at monotonic time at and append its handle
+        to handles, returns the time the next item in the sequence is due.
+        Nothing here blocks, delayed output commands are held by the module
+        thread's scheduler.
 
-        elif self.item_type == ActionSequenceItemType.RunOutputCommand:
-            kwargs = self.extra_params
-            logging.debug(f'Running module {self.module} with command "{self.command}" + {kwargs}')
-            self.module.run_later('run_output_command').with_args(self.command, **kwargs)
+        """
+        if self.item_type == ActionSequenceItemType.RunOutputCommand:
+            deadline = at + self.extra_params.get('delay', 0)
+            logging.debug(f'Running module {self.module} with command "{self.command}" at +{deadline - time.monotonic():.3f} sec')
+            span = trace.span(self.action_sequence.action.name, self.module.module_id) if trace is not None else None
+            handles.append(self.module.run_later(self.module.run_output_command).with_args(self.command, deadline=deadline, span=span))
 
-            return True
         elif self.item_type == ActionSequenceItemType.Wait:
             delay = self.item_data['delay']
-            logging.debug(f'Waiting {delay} seconds...')
-            time.sleep(delay)
-
-            return True
+            logging.debug(f'Next items wait {delay} seconds...')
+            at += delay
 
-        return False
+        return at
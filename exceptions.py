@@ -1,4 +1,3 @@
-import PySimpleGUI as sg
 import traceback
 
 class FxBaseException(Exception):
@@ -53,6 +52,9 @@ class FxUIException(FxBaseException):
     error_type = 'User Interface'
 
 def exception_handler_window(exc):
+    # Only reached with the GUI, headless runs never import it
+    import PySimpleGUI as sg
+
     layout = [
         [sg.Text('Uncaught Exception:')],
         [sg.Output(size=(60,15), key='output', background_color='red', text_color='white', font=('Consolas', 10))],
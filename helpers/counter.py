@@ -0,0 +1,24 @@
+import threading
+
+class AtomicCounter():
+    """
+    Integer counter that many threads may increment at once.
+
+    """
+
+    __slots__ = ('value', 'lock')
+
+    def __init__(self, value=0):
+        self.value = value
+        self.lock = threading.Lock()
+
+    def __int__(self):
+        return self.value
+
+    def __str__(self):
+        return str(self.value)
+
+    def increment(self, amount=1):
+        with self.lock:
+            self.value += amount
+            return self.value
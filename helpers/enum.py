@@ -27,4 +27,9 @@ class ModuleIOType(Enum):
     Invalid = 0
     Input = 1
     Output = 2
-    Bidirectional = 3
\ No newline at end of file
+    Bidirectional = 3
+
+class ConnectionState(Enum):
+    Disconnected = 0
+    Connecting = 1
+    Connected = 2
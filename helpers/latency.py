@@ -0,0 +1,250 @@
+import threading
+import time
+from array import array
+
+class LatencyHistogram():
+    """
+    HDR-style log-linear histogram of durations in microseconds. Every
+    power of two is split into 2**sub_bits linear buckets, so any value is
+    off by at most 1/2**sub_bits of itself, from 1 us up to max_value.
+    Buckets are preallocated, recording only increments a slot.
+
+    """
+
+    __slots__ = ('sub_bits', 'half', 'max_value', 'counts', 'total', 'sum', 'max')
+
+    def __init__(self, sub_bits=4, max_value=60_000_000):
+        self.sub_bits = sub_bits
+        self.half = 1 << sub_bits
+        self.max_value = max_value
+
+        self.counts = array('Q', bytes(8 * (self.index(max_value) + 1)))
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def index(self, value):
+        # Below 2 * half every value has a bucket of its own
+        shift = value.bit_length() - self.sub_bits - 1
+        if shift <= 0:
+            return value
+
+        return shift * self.half + (value >> shift)
+
+    def bucket_upper(self, index):
+        if index < 2 * self.half:
+            return index
+
+        shift = index // self.half - 1
+        return ((index - shift * self.half + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1_000_000), 0), self.max_value)
+
+        self.counts[self.index(value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """
+        Upper bound in seconds of the bucket holding the q-th percentile.
+
+        """
+        if self.total <= 0:
+            return 0.0
+
+        rank = max(1, int(self.total * q / 100 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_upper(index), self.max) / 1_000_000
+
+        return self.max / 1_000_000
+
+    def cumulative(self, bounds):
+        """
+        Number of values at or below each of bounds (sorted, in seconds),
+        to the resolution of the buckets.
+
+        """
+        limits = [ int(bound * 1_000_000) for bound in bounds ]
+        counts = [0] * len(limits)
+
+        seen = 0
+        position = 0
+        for index, count in enumerate(self.counts):
+            upper = self.bucket_upper(index)
+            while position < len(limits) and upper > limits[position]:
+                counts[position] = seen
+                position += 1
+
+            if position >= len(limits):
+                break
+
+            seen += count
+
+        for rest in range(position, len(limits)):
+            counts[rest] = seen
+
+        return counts
+
+    def copy(self):
+        other = LatencyHistogram.__new__(LatencyHistogram)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+
+        other.counts = array('Q', self.counts)
+        return other
+
+    def summary(self):
+        return {
+            'count': self.total,
+            'mean': self.sum / self.total / 1_000_000 if self.total > 0 else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max / 1_000_000,
+        }
+
+
+class LatencyTrace():
+    """
+    Monotonic timestamps of one received GPI chunk, shared by every output
+    command it ends up running.
+
+    """
+
+    __slots__ = ('source', 'received', 'parsed', 'dispatched')
+
+    def __init__(self, source, received, parsed):
+        self.source = source
+        self.received = received
+        self.parsed = parsed
+        self.dispatched = None
+
+    def span(self, action, module):
+        return LatencySpan(self, action, module)
+
+
+class LatencySpan():
+    """
+    Timestamps of a single output command of a traced trigger, from being
+    queued on its module (dispatched) to the transport send completing.
+
+    """
+
+    __slots__ = ('trace', 'action', 'module', 'dispatched', 'started', 'due', 'sent')
+
+    def __init__(self, trace, action, module):
+        self.trace = trace
+        self.action = action
+        self.module = module
+        self.dispatched = time.monotonic()
+        self.started = None
+        self.due = None
+        self.sent = None
+
+
+class LatencyRecorder():
+    """
+    Aggregates finished spans into per-stage, per-action and per-module
+    histograms. Recording takes one short lock and never allocates once a
+    histogram exists; percentiles are only worked out when asked for.
+
+    """
+
+    stages = ('parse', 'dispatch', 'queue', 'delay', 'send', 'total')
+
+    enabled: bool = True
+
+    # Name -> LatencyHistogram
+    by_stage: dict = None
+    by_action: dict = None
+    by_module: dict = None
+
+    # Spans whose send failed, they are not part of the histograms
+    failed: int = 0
+
+    lock: threading.Lock = None
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.by_stage = { stage: LatencyHistogram() for stage in self.stages }
+        self.by_action = {}
+        self.by_module = {}
+        self.lock = threading.Lock()
+
+    def trace(self, source, received, parsed=None):
+        if not self.enabled:
+            return None
+
+        return LatencyTrace(source, received, parsed if parsed is not None else time.monotonic())
+
+    def finish(self, span, result):
+        """
+        Record span once result, the return value of a module's send(), has
+        settled. Deferred results are recorded from their done callback.
+
+        """
+        if not hasattr(result, 'add_done_callback'):
+            span.sent = time.monotonic()
+            self.record(span, result is not False)
+            return
+
+        def settled(done):
+            span.sent = time.monotonic()
+            self.record(span, done.exception() is None and done.result() is not False)
+
+        result.add_done_callback(settled)
+
+    def record(self, span, succeeded=True):
+        if not succeeded:
+            with self.lock:
+                self.failed += 1
+            return
+
+        trace = span.trace
+        durations = (
+            trace.parsed - trace.received,
+            trace.dispatched - trace.parsed,
+            span.started - span.dispatched,
+            span.due - span.started,
+            span.sent - span.due,
+            span.sent - trace.received,
+        )
+
+        with self.lock:
+            for stage, duration in zip(self.stages, durations):
+                self.by_stage[stage].record(duration)
+
+            self.histogram(self.by_action, span.action).record(durations[-1])
+            self.histogram(self.by_module, span.module).record(durations[-1])
+
+    def histogram(self, table, name):
+        histogram = table.get(name, None)
+        if histogram is None:
+            histogram = table[name] = LatencyHistogram()
+
+        return histogram
+
+    def snapshot(self):
+        """
+        Copies of every histogram, taken under the lock so they are consistent.
+
+        """
+        with self.lock:
+            return {
+                'stage': { name: h.copy() for name, h in self.by_stage.items() },
+                'action': { name: h.copy() for name, h in self.by_action.items() },
+                'module': { name: h.copy() for name, h in self.by_module.items() },
+                'failed': self.failed,
+            }
+
+    def summary(self):
+        snapshot = self.snapshot()
+        for group in ('stage', 'action', 'module'):
+            snapshot[group] = { name: h.summary() for name, h in snapshot[group].items() if h.total > 0 }
+
+        return snapshot
@@ -0,0 +1,118 @@
+import re
+
+# Livewire Routing Protocol, line based over TCP port 93
+DEFAULT_PORT = 93
+PIN_COUNT = 5
+
+# KEY:"quoted value" | KEY:value | "quoted" | bare
+TOKEN_PATTERN = re.compile(r'([A-Za-z0-9_]+):"((?:[^"\\]|\\.)*)"|([A-Za-z0-9_]+):(\S+)|"((?:[^"\\]|\\.)*)"|(\S+)')
+
+class LWRPMessage():
+    """
+    One parsed LWRP line, e.g. 'GPI 3 hhlhh' or 'SRC 2 PSNM:"Studio A"'.
+
+    """
+
+    __slots__ = ('verb', 'port', 'args', 'attrs', 'line')
+
+    def __init__(self, verb, port, args, attrs, line):
+        self.verb = verb
+        self.port = port
+        self.args = args
+        self.attrs = attrs
+        self.line = line
+
+    def __str__(self):
+        return f'<LWRPMessage {self.line}>'
+
+
+def parse_line(line):
+    """
+    Returns an LWRPMessage, or None for an empty line.
+
+    """
+    line = line.strip()
+    if len(line) <= 0:
+        return None
+
+    tokens = TOKEN_PATTERN.findall(line)
+    verb = tokens[0][5].upper()
+
+    port = None
+    args = []
+    attrs = {}
+
+    for key, quoted, bare_key, bare_value, string, word in tokens[1:]:
+        if key:
+            attrs[key.upper()] = quoted.replace('\\"', '"')
+        elif bare_key:
+            attrs[bare_key.upper()] = bare_value
+        elif port is None and len(args) <= 0 and word.isdigit():
+            port = int(word)
+        else:
+            args.append(string if string else word)
+
+    return LWRPMessage(verb, port, args, attrs, line)
+
+
+def parse_pins(pattern):
+    """
+    'hhlhh' -> (False, False, True, False, False), True is an active (low)
+    pin. Upper case letters flag a pending change and read the same.
+
+    """
+    if pattern is None or len(pattern) <= 0:
+        return None
+
+    pins = []
+    for char in pattern.lower():
+        if char == 'l':
+            pins.append(True)
+        elif char == 'h':
+            pins.append(False)
+        else:
+            return None
+
+    return tuple(pins)
+
+
+def format_pins(pins):
+    return ''.join('l' if active else 'h' for active in pins)
+
+
+def encode(*parts):
+    return (' '.join(str(part) for part in parts) + '\r\n').encode('ascii', errors='replace')
+
+
+class LWRPFramer():
+    """
+    Splits the byte stream from a node into lines, tolerating LF or CRLF.
+
+    """
+
+    buffer: bytearray = None
+    max_line_size: int = 65536
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+        lines = []
+        start = 0
+        while (end := self.buffer.find(b'\n', start)) >= 0:
+            lines.append(self.buffer[start:end].decode('utf-8', errors='replace').rstrip('\r'))
+            start = end + 1
+
+        if start > 0:
+            del self.buffer[:start]
+
+        if len(self.buffer) > self.max_line_size:
+            # A node never sends lines this long, resync on the next one
+            self.buffer.clear()
+
+        return lines
+
+    def reset(self):
+        self.buffer.clear()
@@ -0,0 +1,108 @@
+import re
+import fnmatch
+import logging
+
+import exceptions
+
+class PayloadMatcher():
+    """
+    Maps received payloads to values. Exact payloads are resolved with a
+    single dict lookup, consecutive Prefix/Wildcard entries are folded into
+    one precompiled alternation and every Regex entry is compiled on its
+    own, so its groups, backreferences and flags mean what they say. These
+    are only consulted when no exact entry hits, in the order they were
+    added.
+
+    """
+
+    match_types = ('Exact', 'Prefix', 'Wildcard', 'Regex')
+
+    exact: dict = None
+
+    # (match_type, source, value) in the order they were added
+    pattern_sources: list = None
+
+    # (compiled pattern, group name -> value or None, value), tried in order
+    segments: list = None
+
+    def __init__(self):
+        self.exact = {}
+        self.pattern_sources = []
+        self.segments = []
+
+    def __len__(self):
+        return len(self.exact) + len(self.pattern_sources)
+
+    def values(self):
+        yield from self.exact.values()
+        yield from (value for _, _, value in self.pattern_sources)
+
+    def add(self, payload, value, match_type='Exact'):
+        if match_type not in self.match_types:
+            raise exceptions.FxConfigException(f'Unknown payload match type "{match_type}".', fatal=True)
+
+        if match_type == 'Exact':
+            if payload in self.exact:
+                logging.warning(f'Duplicate payload "{payload}", only the first definition is used.')
+                return False
+
+            self.exact[payload] = value
+            return True
+
+        if match_type == 'Prefix':
+            source = re.escape(payload) + '.*'
+        elif match_type == 'Wildcard':
+            source = fnmatch.translate(payload)
+        else:
+            source = payload
+
+        try:
+            re.compile(source)
+        except re.error as e:
+            raise exceptions.FxConfigException(f'Invalid {match_type.lower()} payload "{payload}"', e, fatal=True)
+
+        self.pattern_sources.append((match_type, source, value))
+        return True
+
+    def compile(self):
+        segments = []
+        folded = []
+
+        def fold():
+            if len(folded) <= 0:
+                return
+
+            groups = { f'p{index}': value for index, (_, value) in enumerate(folded) }
+            pattern = '|'.join(f'(?P<p{index}>{source})' for index, (source, _) in enumerate(folded))
+            segments.append((re.compile(pattern, re.DOTALL), groups, None))
+            folded.clear()
+
+        for match_type, source, value in self.pattern_sources:
+            if match_type == 'Regex':
+                fold()
+                segments.append((re.compile(source, re.DOTALL), None, value))
+            else:
+                # Generated from literals, safe to share one pattern
+                folded.append((source, value))
+
+        fold()
+        self.segments = segments
+        return self
+
+    def match(self, payload, default=None):
+        value = self.exact.get(payload, None)
+        if value is not None:
+            return value
+
+        for pattern, groups, value in self.segments:
+            matched = pattern.fullmatch(payload)
+            if matched is None:
+                continue
+
+            if groups is None:
+                return value
+
+            # The outermost group closes last, so lastgroup names the entry
+            return groups.get(matched.lastgroup, default)
+
+        return default
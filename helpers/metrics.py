@@ -0,0 +1,71 @@
+class MetricsWriter():
+    """
+    Builds a Prometheus text exposition (format 0.0.4). Families are
+    written in the order they are declared, each with its own samples.
+
+    """
+
+    content_type: str = 'text/plain; version=0.0.4; charset=utf-8'
+
+    # Histogram bucket bounds in seconds
+    default_bounds: tuple = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    prefix: str = None
+    lines: list = None
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lines = []
+
+    def __str__(self):
+        return '\n'.join(self.lines) + '\n'
+
+    @staticmethod
+    def labels(labels):
+        if not labels:
+            return ''
+
+        escape = lambda value: str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+    @staticmethod
+    def value(value):
+        if value == float('inf'):
+            return '+Inf'
+
+        return repr(float(value)) if type(value) is float else str(int(value))
+
+    def family(self, name, metric_type, text):
+        name = f'{self.prefix}_{name}'
+        self.lines.append(f'# HELP {name} {text}')
+        self.lines.append(f'# TYPE {name} {metric_type}')
+        return name
+
+    def sample(self, name, value, labels=None):
+        self.lines.append(f'{name}{self.labels(labels)} {self.value(value)}')
+
+    def metric(self, name, metric_type, text, samples):
+        """
+        Write a counter or gauge family from (labels, value) pairs.
+
+        """
+        name = self.family(name, metric_type, text)
+        for labels, value in samples:
+            self.sample(name, value, labels)
+
+    def histogram(self, name, text, histograms, bounds=None):
+        """
+        Write a histogram family from (labels, LatencyHistogram) pairs.
+
+        """
+        bounds = bounds or self.default_bounds
+        name = self.family(name, 'histogram', text)
+
+        for labels, histogram in histograms:
+            labels = labels or {}
+            for bound, count in zip(bounds, histogram.cumulative(bounds)):
+                self.sample(f'{name}_bucket', count, { **labels, 'le': bound })
+
+            self.sample(f'{name}_bucket', histogram.total, { **labels, 'le': '+Inf' })
+            self.sample(f'{name}_sum', histogram.sum / 1_000_000, labels)
+            self.sample(f'{name}_count', histogram.total, labels)
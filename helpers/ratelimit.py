@@ -0,0 +1,144 @@
+import time
+
+class TokenBucket():
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now, amount=1):
+        self.refill(now)
+        if self.tokens < amount:
+            return False
+
+        self.tokens -= amount
+        return True
+
+
+class RateLimiter():
+    """
+    One token bucket per key, created on first use. A rate of 0 disables
+    the limiter. Not thread safe, owned by a single thread.
+
+    """
+
+    rate: float = 0     # tokens per sec
+    burst: float = 0
+
+    # Idle buckets are dropped once this many keys are tracked
+    max_keys: int = 4096
+
+    buckets: dict = None
+
+    def __init__(self, rate, burst=None, max_keys=None):
+        self.rate = float(rate or 0)
+        self.burst = float(burst if burst is not None else max(self.rate, 1))
+        if max_keys is not None:
+            self.max_keys = max_keys
+
+        self.buckets = {}
+
+    def __bool__(self):
+        return self.rate > 0
+
+    def allow(self, key, now=None):
+        if self.rate <= 0:
+            return True
+
+        if now is None:
+            now = time.monotonic()
+
+        bucket = self.buckets.get(key, None)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.prune(now)
+                if len(self.buckets) >= self.max_keys:
+                    del self.buckets[next(iter(self.buckets))]
+
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+
+        return bucket.take(now)
+
+    def prune(self, now):
+        # A full bucket carries no state, it is the same as a new one
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[key]
+
+
+class Debouncer():
+    """
+    Lets a key through once per window, repeats inside the window are
+    suppressed. A window of 0 disables it. Not thread safe.
+
+    """
+
+    window: float = 0   # sec
+
+    max_keys: int = 4096
+
+    # key -> time it was last let through
+    seen: dict = None
+
+    def __init__(self, window, max_keys=None):
+        self.window = float(window or 0)
+        if max_keys is not None:
+            self.max_keys = max_keys
+
+        self.seen = {}
+
+    def __bool__(self):
+        return self.window > 0
+
+    def allow(self, key, now=None):
+        if self.window <= 0:
+            return True
+
+        if now is None:
+            now = time.monotonic()
+
+        last = self.seen.get(key, None)
+        if last is not None and now - last < self.window:
+            return False
+
+        if last is None and len(self.seen) >= self.max_keys:
+            self.prune(now)
+            if len(self.seen) >= self.max_keys:
+                del self.seen[next(iter(self.seen))]
+
+        self.seen[key] = now
+        return True
+
+    def prune(self, now):
+        for key, last in list(self.seen.items()):
+            if now - last >= self.window:
+                del self.seen[key]
+
+
+class SuppressionStats():
+    """
+    Triggers dropped before reaching the main thread, by reason.
+
+    """
+
+    __slots__ = ('source', 'command', 'debounced')
+
+    def __init__(self):
+        self.source = 0
+        self.command = 0
+        self.debounced = 0
+
+    def __int__(self):
+        return self.source + self.command + self.debounced
+
+    def __str__(self):
+        return f'<SuppressionStats source={self.source} command={self.command} debounced={self.debounced}>'
@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import time
+
+class ScheduledCall():
+    __slots__ = ('deadline', 'callback', 'args', 'kwargs', 'cancelled', 'future')
+
+    def __init__(self, deadline, callback, args, kwargs):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+        # Optional Future settled by the owner thread with the outcome
+        self.future = None
+
+    def __str__(self):
+        return f'<ScheduledCall {getattr(self.callback, "__name__", self.callback)} at={self.deadline:.3f}>'
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler():
+    """
+    Heap of deadlines on the time.monotonic() clock, owned and run by a
+    single thread. The owner sleeps no longer than next_timeout() and calls
+    run_due() when it wakes up, so nothing ever sleeps inside a call.
+
+    """
+
+    heap: list = None
+    sequence = None
+
+    def __init__(self):
+        self.heap = []
+        # Tie breaker, keeps calls sharing a deadline in FIFO order
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def call_at(self, deadline, callback, *args, **kwargs):
+        call = ScheduledCall(deadline, callback, args, kwargs)
+        heapq.heappush(self.heap, (deadline, next(self.sequence), call))
+        return call
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        return self.call_at(time.monotonic() + delay, callback, *args, **kwargs)
+
+    def next_timeout(self, default=None):
+        """
+        Seconds until the next deadline, capped by default. Returns default
+        when nothing is scheduled and 0 when a call is already due.
+
+        """
+        if len(self.heap) <= 0:
+            return default
+
+        timeout = max(self.heap[0][0] - time.monotonic(), 0)
+        if default is not None and default < timeout:
+            return default
+
+        return timeout
+
+    def pop_due(self):
+        """
+        Remove and return every call whose deadline has passed, in order.
+
+        """
+        due = []
+        now = time.monotonic()
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            call = heapq.heappop(self.heap)[2]
+            if not call.cancelled:
+                due.append(call)
+
+        return due
@@ -0,0 +1,169 @@
+import itertools
+import threading
+import time
+from array import array
+
+from helpers.enum import ModuleStatus, ModuleStatusMask
+
+class StatusHistory():
+    """
+    Fixed-size ring of the latest status events of one module, kept in
+    preallocated arrays so recording never allocates. Totals per status
+    flag combination cover the whole lifetime, not just the ring.
+
+    """
+
+    __slots__ = ('size', 'head', 'length', 'times', 'statuses', 'sequences', 'totals')
+
+    # Every ModuleStatus flag combination fits below this
+    status_range = 32
+
+    def __init__(self, size):
+        self.size = size
+        self.head = 0       # next slot to write
+        self.length = 0
+
+        self.times = array('d', bytes(8 * size))
+        self.statuses = array('B', bytes(size))
+        self.sequences = array('Q', bytes(8 * size))
+        self.totals = array('Q', bytes(8 * self.status_range))
+
+    def record(self, timestamp, status, sequence):
+        self.times[self.head] = timestamp
+        self.statuses[self.head] = status
+        self.sequences[self.head] = sequence
+        self.totals[status] += 1
+
+        self.head = (self.head + 1) % self.size
+        if self.length < self.size:
+            self.length += 1
+
+    def last(self, n=None):
+        """
+        Up to n (timestamp, status, sequence) events, oldest first.
+
+        """
+        n = self.length if n is None else min(n, self.length)
+        start = (self.head - n) % self.size
+        return [
+            (self.times[i], ModuleStatus(self.statuses[i]), self.sequences[i])
+            for i in ((start + k) % self.size for k in range(n))
+        ]
+
+
+class StatusStore():
+    """
+    Latest ModuleStatus per module plus a short history of each. Every
+    write is a compare-and-set under one short lock and is stamped with a
+    global sequence number. Readers of the latest status never lock, they
+    swap in a (status, sequence) tuple and pick up only what changed since
+    the sequences they have already seen.
+
+    """
+
+    # module_id -> (status, sequence)
+    entries: dict = None
+
+    # module_id -> StatusHistory
+    histories: dict = None
+    history_size: int = 64
+
+    # Sequence of the latest write, a cheap "anything new?" check for readers
+    version: int = 0
+
+    sequence = None
+    lock: threading.Lock = None
+
+    def __init__(self, history_size=None):
+        if history_size is not None:
+            self.history_size = history_size
+
+        self.entries = {}
+        self.histories = {}
+        self.sequence = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, module_id):
+        return module_id in self.entries
+
+    def get(self, module_id, default=None):
+        entry = self.entries.get(module_id, None)
+        return entry[0] if entry is not None else default
+
+    def set(self, module_id, status):
+        return self.transition(module_id, status)
+
+    def transition(self, module_id, status, expected=None):
+        """
+        Set status, only if the current one equals expected when given.
+        Returns the sequence of the write, or None when the check failed.
+
+        """
+        with self.lock:
+            entry = self.entries.get(module_id, None)
+            if expected is not None and (entry is None or entry[0] != expected):
+                return None
+
+            sequence = next(self.sequence)
+            self.entries[module_id] = (status, sequence)
+
+            history = self.histories.get(module_id, None)
+            if history is None:
+                history = self.histories[module_id] = StatusHistory(self.history_size)
+
+            history.record(time.time(), int(status), sequence)
+            self.version = sequence
+
+        return sequence
+
+    def changed_since(self, seen):
+        """
+        (module_id, status, sequence) for every module written after the
+        sequence recorded for it in seen.
+
+        """
+        return [
+            (module_id, status, sequence)
+            for module_id, (status, sequence) in list(self.entries.items())
+            if sequence > seen.get(module_id, 0)
+        ]
+
+    # Queries
+
+    def last_events(self, module_id, n=None):
+        """
+        Up to n of the latest (timestamp, status, sequence) events of a
+        module, oldest first.
+
+        """
+        with self.lock:
+            history = self.histories.get(module_id, None)
+            return history.last(n) if history is not None else []
+
+    def events_since(self, module_id, sequence):
+        return [ event for event in self.last_events(module_id) if event[2] > sequence ]
+
+    def counts(self, module_id):
+        """
+        How often each status (Running, Warning, Error, ...) was set on a
+        module, activity flags folded into their status.
+
+        """
+        counts = {}
+        with self.lock:
+            history = self.histories.get(module_id, None)
+            if history is None:
+                return counts
+
+            for status, count in enumerate(history.totals):
+                if count > 0:
+                    base = ModuleStatus(status & ModuleStatusMask.StatusMask)
+                    counts[base] = counts.get(base, 0) + count
+
+        return counts
+
+    def summary(self):
+        return { module_id: self.counts(module_id) for module_id in list(self.histories) }
@@ -0,0 +1,94 @@
+import bisect
+import ipaddress
+import logging
+import socket
+from functools import lru_cache
+
+import exceptions
+
+# ::ffff:0:0/96, IPv4-mapped IPv6 senders are checked against the IPv4 entries
+V4_MAPPED_PREFIX = 0xffff << 32
+V4_MAPPED_MASK = ~0xffffffff
+
+class IPWhitelist():
+    """
+    AllowedIP networks compiled once at init into sorted, merged integer
+    ranges per address family, looked up with bisect. Sender lookups are
+    memoized in a bounded LRU and allocate no ipaddress objects. Safe to
+    share between threads. An empty whitelist allows nobody.
+
+    """
+
+    owner: str = None
+
+    # family -> ascending range starts and the matching inclusive ends
+    starts: dict = None
+    ends: dict = None
+
+    cache_size: int = 1024
+
+    def __init__(self, owner, entries, cache_size=None):
+        self.owner = owner
+        if cache_size is not None:
+            self.cache_size = cache_size
+
+        ranges = {socket.AF_INET: [], socket.AF_INET6: []}
+        for entry in entries:
+            try:
+                network = ipaddress.ip_network(entry.strip())
+            except (AttributeError, ValueError) as e:
+                raise exceptions.FxConfigException(f'{owner} whitelist address invalid: {entry}', e, fatal=True)
+
+            family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+            ranges[family].append((int(network.network_address), int(network.broadcast_address)))
+            logging.debug(f'{owner} whitelist address valid: {entry}')
+
+        self.starts = {}
+        self.ends = {}
+        for family, spans in ranges.items():
+            self.starts[family], self.ends[family] = self.merge(spans)
+
+        self.lookup = lru_cache(maxsize=self.cache_size)(self.match)
+
+    def __len__(self):
+        return sum(len(starts) for starts in self.starts.values())
+
+    def __str__(self):
+        return f'<IPWhitelist {self.owner} ranges={len(self)}>'
+
+    @staticmethod
+    def merge(spans):
+        starts = []
+        ends = []
+        for start, end in sorted(spans):
+            if len(ends) > 0 and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        return starts, ends
+
+    def allows(self, host):
+        return self.lookup(host)
+
+    def match(self, host):
+        try:
+            if ':' in host:
+                value = int.from_bytes(socket.inet_pton(socket.AF_INET6, host.split('%', 1)[0]), 'big')
+                if value & V4_MAPPED_MASK == V4_MAPPED_PREFIX:
+                    return self.contains(socket.AF_INET, value & 0xffffffff)
+
+                return self.contains(socket.AF_INET6, value)
+
+            return self.contains(socket.AF_INET, int.from_bytes(socket.inet_pton(socket.AF_INET, host), 'big'))
+        except (OSError, ValueError):
+            return False
+
+    def contains(self, family, value):
+        starts = self.starts[family]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self.ends[family][i]
+
+    def cache_info(self):
+        return self.lookup.cache_info()
@@ -1,5 +1,7 @@
+import argparse
 import logging
 import os
+import signal
 import sys
 
 import exceptions
@@ -9,6 +11,10 @@ from helpers.app import terminate_process
 # Entrypoint for app
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description='Simple, lightweight and robust GPIO client and server for radio facilities.')
+    parser.add_argument('--headless', action='store_true', help='run without the GUI, e.g. as a system service')
+    args = parser.parse_args()
+
     # Setup logging
     logging.basicConfig(format='%(asctime)s [%(threadName)s] %(levelname)s: %(message)s', datefmt='%d %b %Y %H:%M:%S', level=logging.INFO)
     logging.debug('Logging initialized.')
@@ -22,7 +28,12 @@ if __name__ == '__main__':
     exit_code: int = 0
     logging.info('Creating main application...')
     try:
-        app = FxGpioApp(run_dir=run_dir)
+        app = FxGpioApp(run_dir=run_dir, headless=args.headless)
+
+        if args.headless:
+            # Service managers stop us with SIGTERM
+            signal.signal(signal.SIGTERM, lambda signum, frame: app.run_later('shutdown').run())
+
         try:
             logging.debug('Running main app')
             exit_code = app.run()
@@ -36,7 +47,8 @@ if __name__ == '__main__':
 
     except Exception as e:
         logging.exception(e)
-        exceptions.exception_handler_window(e)
+        if not args.headless:
+            exceptions.exception_handler_window(e)
         os._exit(1)
 
     terminate_process(exit_code)
\ No newline at end of file
@@ -0,0 +1,138 @@
+import socket
+import time
+
+import pytest
+
+from helpers.latency import LatencyRecorder
+from threads.dispatch import Dispatcher
+from threads.gpio import GPIConnection, GPIThread
+
+class FakeApp():
+
+    def __init__(self, config):
+        self.dispatcher = Dispatcher()
+        self.latency = LatencyRecorder()
+        self.batches = []
+        self.config = { 'Modules': { 'GPI': {
+            'Protocol': 'tcp',
+            'Listen': '127.0.0.1',
+            'Port': 0,
+            'Separator': '\n',
+            'AllowedIP': ['127.0.0.0/8'],
+            'InputCommands': [{ 'Payload': r'cmd\d+', 'Match': 'Regex', 'Actions': ['go'] }],
+            **config,
+        }}}
+
+    def update_module_status(self, module, status, update_if=None):
+        return status
+
+    def run_actions_later(self, actions, trace=None):
+        self.batches.append(actions)
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+
+    return predicate()
+
+
+@pytest.fixture
+def start_gpi():
+    started = []
+
+    def start(**config):
+        module = GPIThread(FakeApp(config), 'GPI')
+        module.sweep_interval = 0.05
+        module.start()
+        started.append(module)
+
+        sender = socket.create_connection(module.socket.getsockname()[:2])
+        return module, sender
+
+    yield start
+
+    for module in started:
+        module.run_later('shutdown').run()
+        module.join(3)
+
+
+def burst(count):
+    return b''.join(b'cmd%d\n' % i for i in range(count))
+
+
+def test_take_frames_keeps_partial_frame():
+    connection = GPIConnection(None, ('127.0.0.1', 0))
+
+    connection.buffer += b'cmd1'
+    assert connection.take_frames(b'\r\n') is None
+
+    connection.buffer += b'\r\ncmd2\r\ncm'
+    assert connection.take_frames(b'\r\n') == b'cmd1\r\ncmd2\r\n'
+    assert connection.buffer == b'cm'
+
+    assert connection.take_remainder() == b'cm'
+    assert connection.take_remainder() == b''
+
+
+@pytest.mark.parametrize('keep_open', [False, True])
+def test_burst_larger_than_recv_buffer(start_gpi, keep_open):
+    gpi, sender = start_gpi(KeepOpen=keep_open)
+
+    data = burst(1000)
+    assert len(data) > 4 * gpi.recv_buffer
+
+    sender.sendall(data)
+    if not keep_open:
+        sender.close()
+
+    # Frames cut by a read boundary would show up as unmatched halves
+    assert wait_until(lambda: gpi.commands_received == 1000)
+    assert gpi.commands_matched == 1000 and gpi.commands_unmatched == 0
+    assert all(batch == ('go',) for batch in gpi.parent.batches)
+
+    assert wait_until(lambda: len(gpi.connections) == (1 if keep_open else 0))
+    sender.close()
+
+
+@pytest.mark.parametrize('keep_open', [False, True])
+def test_frame_split_across_reads(start_gpi, keep_open):
+    gpi, sender = start_gpi(KeepOpen=keep_open)
+
+    sender.sendall(b'cmd1\ncmd')
+    assert wait_until(lambda: gpi.commands_received == 1)
+
+    sender.sendall(b'23\n')
+    assert wait_until(lambda: gpi.commands_received == 2)
+    assert gpi.commands_unmatched == 0
+    sender.close()
+
+
+def test_remainder_taken_on_eof(start_gpi):
+    gpi, sender = start_gpi()
+
+    sender.sendall(b'cmd1\ncmd2')
+    assert wait_until(lambda: gpi.commands_received == 1)
+
+    sender.close()
+    assert wait_until(lambda: gpi.commands_received == 2)
+    assert gpi.commands_matched == 2
+    assert wait_until(lambda: len(gpi.connections) == 0)
+
+
+def test_idle_connection_reaped_with_remainder(start_gpi):
+    gpi, sender = start_gpi(KeepOpen=True, IdleTimeout=0.2)
+
+    sender.sendall(b'cmd1\ncmd2')
+    assert wait_until(lambda: gpi.commands_received == 1)
+
+    # The sender never terminates its last command nor closes
+    assert wait_until(lambda: len(gpi.connections) == 0)
+    assert gpi.commands_received == 2 and gpi.commands_matched == 2
+
+    sender.settimeout(2)
+    assert sender.recv(1) == b''
+    sender.close()
@@ -0,0 +1,216 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import exceptions
+from action import Action, ActionRegistry
+from helpers import lwrp
+from threads.dispatch import Dispatcher
+from threads.livewire import LivewireThread
+
+class FakeNode():
+    """
+    Loopback LWRP node: answers GPI/GPO queries from its pin tables, applies
+    GPO commands and records every line it receives.
+
+    """
+
+    def __init__(self):
+        self.gpi = { 1: 'hhhhh' }
+        self.gpo = { 1: 'hhhhh' }
+
+        # Pin types whose queries go unanswered
+        self.silent = set()
+
+        self.lines = []
+        self.clients = []
+        self.lock = threading.Lock()
+
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+
+            with self.lock:
+                self.clients.append(client)
+
+            threading.Thread(target=self.handle, args=(client,), daemon=True).start()
+
+    def handle(self, client):
+        for line in client.makefile('rb'):
+            line = line.decode().strip()
+            with self.lock:
+                self.lines.append(line)
+
+            message = lwrp.parse_line(line)
+            if message is None:
+                continue
+
+            if message.verb in self.silent:
+                continue
+
+            if message.verb in ('GPI', 'GPO') and message.port is None:
+                table = self.gpi if message.verb == 'GPI' else self.gpo
+                client.sendall(b''.join(lwrp.encode(message.verb, port, pins) for port, pins in table.items()))
+            elif message.verb == 'GPO':
+                self.gpo[message.port] = message.args[0]
+                client.sendall(lwrp.encode('GPO', message.port, message.args[0]))
+
+    def push(self, line):
+        with self.lock:
+            for client in self.clients:
+                client.sendall(line.encode() + b'\r\n')
+
+    def drop(self):
+        with self.lock:
+            for client in self.clients:
+                client.shutdown(socket.SHUT_RDWR)
+                client.close()
+
+            self.clients.clear()
+            self.lines.clear()
+
+    def close(self):
+        self.drop()
+        self.server.close()
+
+
+class FakeApp():
+
+    def __init__(self, port):
+        self.dispatcher = Dispatcher()
+        self.ran = []
+        self.config = { 'Modules': { 'Livewire': {
+            'ReconnectMin': 0.05,
+            'ReconnectMax': 0.1,
+            'Nodes': [{ 'Name': 'N1', 'Hostname': '127.0.0.1', 'Port': port, 'Password': 'pw' }],
+            'InputCommands': [
+                { 'Node': 'N1', 'Port': 1, 'Pin': 3, 'State': 'Low', 'Actions': ['on'] },
+                { 'Node': 'N1', 'Port': 1, 'Pin': 3, 'State': 'High', 'Actions': ['off'] },
+            ],
+            'OutputCommands': [
+                { 'Name': 'pin2_low', 'Node': 'N1', 'Port': 1, 'Pin': 2, 'State': 'Low' },
+                { 'Name': 'pattern', 'Node': 'N1', 'Port': 1, 'Pins': 'hxxlx' },
+            ],
+        }}}
+
+    def update_module_status(self, module, status, update_if=None):
+        return status
+
+    def run_action_later(self, action):
+        self.ran.append(action.name)
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+
+    return predicate()
+
+
+@pytest.fixture
+def node():
+    node = FakeNode()
+    yield node
+    node.close()
+
+
+@pytest.fixture
+def livewire(node):
+    app = FakeApp(node.port)
+
+    actions = ActionRegistry()
+    for name in ('on', 'off'):
+        actions.add(Action(app, { 'Name': name, 'Sequence': [] }))
+
+    module = LivewireThread(app, 'Livewire')
+    module.resolve_actions(actions)
+    module.start()
+
+    # Session is up once both tables are seeded
+    assert wait_until(lambda: 1 in module.nodes['N1'].gpi and 1 in module.nodes['N1'].gpo)
+
+    yield module
+
+    module.run_later('shutdown').run()
+    module.join(3)
+
+
+def test_login_and_subscribe(node, livewire):
+    assert node.lines[:6] == ['LOGIN pw', 'ADD GPI', 'ADD GPO', 'ADD SRC', 'GPI', 'GPO']
+
+
+def test_gpi_edges_and_seeding_on_reconnect(node, livewire):
+    app = livewire.parent
+
+    # Initial report only seeded the table
+    assert app.ran == []
+
+    node.push('GPI 1 hhlhh')
+    assert wait_until(lambda: app.ran == ['on'])
+
+    node.push('GPI 1 hhlhh')
+    node.push('GPI 1 hhhhh')
+    assert wait_until(lambda: app.ran == ['on', 'off'])
+
+    # Pin went active while the session was down, the new session seeds it silently
+    node.gpi[1] = 'hhlhh'
+    node.drop()
+    assert wait_until(lambda: 'GPI' in node.lines and livewire.nodes['N1'].gpi.get(1) == lwrp.parse_pins('hhlhh'))
+    assert app.ran == ['on', 'off']
+
+    node.push('GPI 1 hhhhh')
+    assert wait_until(lambda: app.ran == ['on', 'off', 'off'])
+
+
+def test_gpo_keeps_untouched_pins(node, livewire):
+    node.push('GPO 1 lhhhl')
+    assert wait_until(lambda: livewire.nodes['N1'].gpo[1] == lwrp.parse_pins('lhhhl'))
+
+    assert livewire.run_later('run_output_command').with_args('pin2_low').result(2) is True
+    assert wait_until(lambda: 'GPO 1 llhhl' in node.lines)
+    assert wait_until(lambda: livewire.nodes['N1'].gpo[1] == lwrp.parse_pins('llhhl'))
+
+    assert livewire.run_later('run_output_command').with_args('pattern').result(2) is True
+    assert wait_until(lambda: 'GPO 1 hlhll' in node.lines)
+
+
+def test_gpo_refused_while_kept_pins_unknown(node, livewire):
+    # New session, the node has not answered the GPO query yet
+    node.silent.add('GPO')
+    node.drop()
+    assert wait_until(lambda: 'GPO' in node.lines and 1 in livewire.nodes['N1'].gpi)
+    assert 1 not in livewire.nodes['N1'].gpo
+
+    assert livewire.run_later('run_output_command').with_args('pin2_low').result(2) is False
+    assert livewire.run_later('run_output_command').with_args('pattern').result(2) is False
+    assert not any(line.startswith('GPO 1') for line in node.lines)
+
+    node.push('GPO 1 lhhhl')
+    assert wait_until(lambda: livewire.nodes['N1'].gpo.get(1) == lwrp.parse_pins('lhhhl'))
+
+    assert livewire.run_later('run_output_command').with_args('pin2_low').result(2) is True
+    assert wait_until(lambda: 'GPO 1 llhhl' in node.lines)
+
+
+def test_kept_pins_need_gpo_subscription(node):
+    app = FakeApp(node.port)
+    app.config['Modules']['Livewire']['Nodes'][0]['Subscribe'] = ['GPI', 'SRC']
+
+    with pytest.raises(exceptions.FxConfigException, match='must subscribe to GPO'):
+        LivewireThread(app, 'Livewire')
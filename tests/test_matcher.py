@@ -0,0 +1,97 @@
+import pytest
+
+import exceptions
+from helpers.matcher import PayloadMatcher
+
+def build(*entries):
+    matcher = PayloadMatcher()
+    for payload, value, match_type in entries:
+        matcher.add(payload, value, match_type)
+
+    return matcher.compile()
+
+
+def test_exact_wins_over_patterns():
+    matcher = build(
+        ('ON*', 'wildcard', 'Wildcard'),
+        ('ON1', 'exact', 'Exact'),
+    )
+
+    assert matcher.match('ON1') == 'exact'
+    assert matcher.match('ON2') == 'wildcard'
+
+
+def test_first_match_wins_across_types():
+    matcher = build(
+        ('CART', 'prefix', 'Prefix'),
+        ('CART?', 'wildcard', 'Wildcard'),
+        (r'CART\d', 'regex', 'Regex'),
+        ('CA', 'late_prefix', 'Prefix'),
+    )
+
+    assert matcher.match('CART1') == 'prefix'
+    assert matcher.match('CAT') == 'late_prefix'
+
+    matcher = build(
+        (r'CART\d', 'regex', 'Regex'),
+        ('CART', 'prefix', 'Prefix'),
+    )
+
+    assert matcher.match('CART1') == 'regex'
+    assert matcher.match('CARTX') == 'prefix'
+
+
+def test_consecutive_patterns_are_folded():
+    matcher = build(
+        ('A', 'a', 'Prefix'),
+        ('B*', 'b', 'Wildcard'),
+        ('C?', 'c', 'Wildcard'),
+        ('R.+', 'r', 'Regex'),
+        ('D', 'd', 'Prefix'),
+    )
+
+    # Prefix/Wildcard runs share a pattern, each regex keeps its own
+    assert len(matcher.segments) == 3
+    assert len(matcher) == 5
+    assert [matcher.match(payload) for payload in ('A1', 'B22', 'C3', 'RX', 'D4')] == ['a', 'b', 'c', 'r', 'd']
+
+
+def test_regex_keeps_its_groups_and_flags():
+    matcher = build(
+        ('X1', 'prefix', 'Prefix'),
+        (r'(?i)x(\d)\1', 'repeat', 'Regex'),
+    )
+
+    assert matcher.match('x11') == 'repeat'
+    assert matcher.match('X11') == 'prefix'
+    assert matcher.match('X22') == 'repeat'
+    assert matcher.match('X23') is None
+
+
+def test_backreference_regex():
+    matcher = build((r'(?i)x(\d)\1', 'repeat', 'Regex'))
+
+    assert matcher.match('X11') == 'repeat'
+    assert matcher.match('X12') is None
+
+
+def test_no_match_returns_default():
+    matcher = build(
+        ('ON', 'on', 'Exact'),
+        ('OFF', 'off', 'Prefix'),
+        ('ST*', 'status', 'Wildcard'),
+    )
+
+    assert matcher.match('PING') is None
+    assert matcher.match('PING', 'fallback') == 'fallback'
+    assert matcher.match('') is None
+
+
+def test_invalid_pattern_is_a_config_error():
+    matcher = PayloadMatcher()
+
+    with pytest.raises(exceptions.FxConfigException):
+        matcher.add('(', 'broken', 'Regex')
+
+    with pytest.raises(exceptions.FxConfigException):
+        matcher.add('ON', 'on', 'Glob')
@@ -0,0 +1,152 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import exceptions
+from threads import SubThreadBase, when_all, wait_for
+from threads.dispatch import Dispatcher
+
+class FakeApp():
+
+    def __init__(self):
+        self.dispatcher = Dispatcher()
+
+    def update_module_status(self, module, status, update_if=None):
+        return status
+
+
+class Worker(SubThreadBase):
+
+    def init(self):
+        self.errors = []
+        self.release = threading.Event()
+        self.initialized = True
+
+    def handle_call_exception(self, e):
+        self.errors.append(e)
+
+    def ok(self):
+        return True
+
+    def fail(self):
+        return False
+
+    def boom(self):
+        raise exceptions.FxInternalException('boom')
+
+    def defer(self, future):
+        return future
+
+    def block(self):
+        self.release.wait(2)
+
+
+@pytest.fixture
+def worker():
+    worker = Worker(FakeApp(), 'Worker')
+    worker.start()
+
+    yield worker
+
+    worker.release.set()
+    worker.run_later('shutdown').run()
+    worker.join(2)
+
+
+def test_result_propagates(worker):
+    results = []
+    item = worker.run_later('ok').attach_callback(results.append).run()
+
+    assert item.result(2) is True
+    assert results == [True]
+    assert item.done() and not item.cancelled()
+
+
+def test_exception_propagates(worker):
+    item = worker.run_later('boom').run()
+
+    assert isinstance(item.exception(2), exceptions.FxInternalException)
+    with pytest.raises(exceptions.FxInternalException):
+        item.result(2)
+
+    assert worker.errors == [item.exception()]
+
+
+def test_deferred_result_follows_future(worker):
+    future = Future()
+    item = worker.run_later('defer').with_args(future)
+
+    assert wait_for([item], timeout=0.1).not_done == { item.get_future() }
+
+    future.set_result('late')
+    assert item.result(2) == 'late'
+
+
+def test_cancelled_before_running(worker):
+    worker.run_later('block').run()
+    item = worker.run_later('ok').run()
+
+    assert item.cancel()
+    worker.release.set()
+
+    # Processed in order, so the cancelled item was skipped by now
+    assert worker.run_later('ok').run().result(2) is True
+    assert item.cancelled()
+
+
+def test_when_all_mixed_outcomes(worker):
+    future = Future()
+    handles = [
+        worker.run_later('ok').run(),
+        worker.run_later('defer').with_args(future),
+        worker.run_later('fail').run(),
+        worker.run_later('boom').run(),
+    ]
+
+    settled = threading.Event()
+    seen = []
+    when_all(handles, lambda done: (seen.append(done), settled.set()))
+
+    assert not settled.wait(0.1)
+
+    future.set_result(True)
+    assert settled.wait(2)
+
+    assert seen == [handles]
+    assert [h.exception() is None and h.result() for h in handles] == [True, True, False, False]
+
+
+def test_when_all_empty_calls_back_at_once():
+    seen = []
+    when_all([], seen.append)
+
+    assert seen == [[]]
+
+
+def test_wait_for_mixes_items_and_futures(worker):
+    future = Future()
+    item = worker.run_later('ok').run()
+
+    done, not_done = wait_for([item, future], timeout=0.1)
+    assert done == { item.get_future() } and not_done == { future }
+
+    future.set_result(None)
+    done, not_done = wait_for([item, future], timeout=2)
+    assert len(done) == 2 and len(not_done) == 0
+
+
+def test_item_dropped_at_shutdown(worker):
+    worker.run_later('block').run()
+    worker.run_later('shutdown').run()
+    stranded = worker.run_later('ok').run()
+
+    worker.release.set()
+    worker.join(2)
+
+    # Queued behind the shutdown, the exiting thread fails it instead of leaving it pending
+    assert isinstance(stranded.exception(2), exceptions.FxInternalException)
+    assert int(worker.dispatch_stats.dropped) == 1
+
+    late = worker.run_later('ok').run()
+    assert isinstance(late.exception(2), exceptions.FxInternalException)
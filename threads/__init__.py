@@ -1,12 +1,19 @@
-from threading import Thread
+from threading import Thread, Lock
 from queue import Queue, Empty
+from concurrent.futures import Future, CancelledError, InvalidStateError, wait
+from types import MappingProxyType
+import selectors
 import logging
+import socket
 import time
 
 import exceptions
 
 from helpers import multi_getattr
+from helpers.scheduler import Scheduler
 from helpers.enum import ModuleStatus, ModuleIOType
+from threads.dispatch import Dispatcher, DispatchStats
+from threads.transport import PersistentConnection
 
 class ThreadBase():
 
@@ -16,14 +23,22 @@ class ThreadBase():
     # Thread queue
     queue: Queue = None
 
+    # Deadline scheduler, run by this thread only
+    scheduler: Scheduler = None
+
+    # Shared queue router and this thread's counters in it
+    dispatcher: Dispatcher = None
+    dispatch_stats: DispatchStats = None
+
+    # Method string -> resolved bound method
+    method_cache: dict = None
+
     # Thread exit flag
     exit: bool = False
 
-    # Queue settings
+    # Queue settings, a blocking queue sleeps until woken by an item or a deadline
     queue_blocking: bool = True
-    queue_rate: int = 5      # Hz
-    queue_timeout: int = 10  # sec
-    queue_cooldown: float = 0.2 # sec
+    queue_timeout: float = None  # sec
 
     # Consts for self checking
     is_mainthread = False
@@ -35,13 +50,38 @@ class ThreadBase():
 
     def __init__(self):
         logging.info(f'Initializing thread for {self.__class__.__name__}')
+        self.method_cache = {}
         self.init_queue()
+        self.init_dispatcher()
+        self.scheduler = Scheduler()
 
     def init_queue(self) -> None:
         self.queue = Queue()
 
-    def run_later(self, method_name):
-        return FxQueueItem(self.__class__, method_name).set_sender(self, auto_add_queue_sender=True) 
+    def init_dispatcher(self):
+        # Subthreads share the router of the thread that created them
+        self.dispatcher = self.parent.dispatcher if self.parent is not None else Dispatcher()
+        self.dispatcher.register(self)
+
+    def run_later(self, method):
+        """
+        Queue a call on this thread, method is either a (dotted) method name
+        or an already bound callable, which skips the name lookup entirely.
+
+        """
+        return FxQueueItem(self, method)
+
+    def resolve_method(self, method):
+        if type(method) is not str:
+            return method
+
+        # Resolved once per name, the attributes on the path are never rebound
+        to_call = self.method_cache.get(method, None)
+        if to_call is None:
+            to_call = multi_getattr(self, method)
+            self.method_cache[method] = to_call
+
+        return to_call
 
     def pre_start(self):
         pass
@@ -49,52 +89,124 @@ class ThreadBase():
     def tick(self):
         pass
 
+    def wake(self):
+        # Queue.get() already wakes on put, threads blocking elsewhere override this
+        pass
+
     def wait_for_queue(self):
-        logging.debug(f'Waiting for queue, block={self.queue_blocking}, timeout={self.queue_timeout}')
+        if not self.queue_blocking:
+            # This thread blocks elsewhere in tick(), only take what is pending
+            return self.drain_queue()
+
+        # Never sleep past the next scheduled deadline
+        timeout = self.scheduler.next_timeout(self.queue_timeout)
+
+        logging.debug(f'Waiting for queue, timeout={timeout}')
         try:
-            item = self.queue.get(block=self.queue_blocking, timeout=self.queue_timeout)
+            item = self.queue.get(timeout=timeout)
         except Empty:
-            item = None
-
-        if item is None:
-            if self.queue_cooldown != 0:
-                logging.debug(f'QueueItem is None, waiting {self.queue_cooldown} sec cooldown...')
-                time.sleep(self.queue_cooldown)
             return False
 
-        if item.target is not self.__class__:
-            logging.debug(f'Skipping QueueItem for targeted for "{item.target}"')
-            return False
+        return self.dispatch_queue_item(item)
+
+    def drain_queue(self):
+        processed = False
+        while not self.exit:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+
+            self.dispatch_queue_item(item)
+            processed = True
+
+        return processed
 
-        return self.process_queue(item)
+    def dispatch_queue_item(self, item):
+        self.dispatch_stats.delivered.increment()
+
+        started = time.monotonic()
+        try:
+            return self.process_queue(item)
+        finally:
+            self.dispatch_stats.busy.record(time.monotonic() - started)
 
     def process_queue(self, item):
         logging.debug(f'Process queue triggered: {item}')
 
-        to_call = multi_getattr(self, item.method)
+        if not item.set_running():
+            logging.debug(f'{item} was cancelled, skipping')
+            return False
+
+        to_call = self.resolve_method(item.method)
         try:
             result = to_call(*item.args, **item.kwargs)
         except exceptions.FxBaseException as e:
-            logging.error(e)
+            item.set_exception(e)
+            self.handle_call_exception(e)
+            return False
+        except BaseException as e:
+            item.set_exception(e)
+            raise
+
+        if isinstance(result, (Future, FxQueueItem)):
+            # Deferred work, e.g. a delayed output command, settles the item later
+            logging.debug(f'{item} deferred to {result}')
+            item.follow(result)
+        else:
+            logging.debug(f'{item} returned result: {result}')
+            item.set_result(result)
+
+        return result
+
+    def call_at(self, deadline, callback, *args, **kwargs):
+        """
+        Run callback on this thread at monotonic time deadline, returns a
+        Future settled with its outcome.
+
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.scheduler.call_at(deadline, callback, *args, **kwargs).future = future
+        return future
+
+    def run_scheduled(self):
+        for call in self.scheduler.pop_due():
+            logging.debug(f'Running scheduled call {call}')
+            try:
+                result = call.callback(*call.args, **call.kwargs)
+            except exceptions.FxBaseException as e:
+                if call.future is not None:
+                    call.future.set_exception(e)
+                self.handle_call_exception(e)
+                continue
+            except BaseException as e:
+                if call.future is not None:
+                    call.future.set_exception(e)
+                raise
 
-            args = ('Runtime Error', e.get_alert_str())
-            kwargs = { 'custom_text': ('Exit' if e.fatal else 'OK') }
+            if call.future is None:
+                continue
 
-            if self.is_mainthread:
-                self.UI.show_error(*args, **kwargs)
+            if isinstance(result, (Future, FxQueueItem)):
+                # e.g. an HTTP send, the delayed call is only done once it is
+                future = call.future
+                result.add_done_callback(lambda done: forward_outcome(done, future.set_result, future.set_exception))
             else:
-                self.parent.run_later('UI.show_error').with_args(*args, **kwargs)
+                call.future.set_result(result)
 
-            if e.fatal:
-                self.shutdown()
+    def handle_call_exception(self, e):
+        logging.error(e)
 
-            return False
+        args = ('Runtime Error', e.get_alert_str())
+        kwargs = { 'custom_text': ('Exit' if e.fatal else 'OK') }
 
-        if item.callback is not None:
-            logging.debug(f'{item} returned result: {result}, forwarding to callback function {item.callback}')
-            item.callback(result)
-        else:
-            logging.debug(f'{item} returned result: {result}')
+        # The UI has its own thread, never touch it from here
+        ui = self.UI if self.is_mainthread else self.parent.UI
+        ui.run_later('show_error').with_args(*args, **kwargs)
+
+        if e.fatal:
+            self.shutdown()
 
     def main_loop(self):
         logging.debug('Main loop started')
@@ -104,14 +216,8 @@ class ThreadBase():
 
         while not self.exit:
             self.tick()
-
-            queue_result = self.wait_for_queue()
-            if queue_result is not False:
-                logging.debug('Queue result is not False, continuing...')
-                continue
-
-            if not self.queue_blocking and self.queue_rate != 0:
-                time.sleep(1 / self.queue_rate)
+            self.run_scheduled()
+            self.wait_for_queue()
 
     def run(self):
         logging.info(f'{self.name} started.')
@@ -120,6 +226,8 @@ class ThreadBase():
             self.main_loop()
         except exceptions.FxBaseException as e:
             self.handle_runtime_exception(e)
+        finally:
+            self.dispatcher.close(self)
 
         logging.info(f'{self.name} exited.')
 
@@ -152,15 +260,20 @@ class SubThreadBase(ThreadBase, Thread):
     # Init Successful
     initialized = False
 
+    # Output command tables built at init, Name -> command and display label -> command
+    output_commands: MappingProxyType = MappingProxyType({})
+    output_command_labels: MappingProxyType = MappingProxyType({})
+
     # Consts for self checking
     is_subthread = True
 
     def __init__(self, parent, module_id, *args, **kwargs):
+        self.parent = parent
+
         Thread.__init__(self, *args, **kwargs)
         ThreadBase.__init__(self, *args, **kwargs)
 
         self.initialized = False
-        self.parent = parent
         self.module_id = module_id
 
         self.parent.update_module_status(self, ModuleStatus.Enabled)
@@ -183,16 +296,81 @@ class SubThreadBase(ThreadBase, Thread):
         self.parent.update_module_status(self, ModuleStatus.Running, update_if=ModuleStatus.Initialized)
         super(SubThreadBase, self).main_loop()
 
-    def run_output_command(self, output_command, delay=None):
+    def resolve_actions(self, actions):
+        pass
+
+    def run_output_command(self, output_command, delay=None, deadline=None, span=None):
+        if span is not None:
+            span.started = time.monotonic()
+
         if delay is not None:
-            logging.info(f'Delaying action execution by {delay} sec...')
-            time.sleep(delay)
+            deadline = time.monotonic() + delay
+
+        if deadline is not None and (remaining := deadline - time.monotonic()) > 0:
+            # Keep the thread free for other outputs until the command is due
+            logging.info(f'Delaying output command "{output_command}" by {remaining:.3f} sec...')
+            return self.call_at(deadline, self.run_output_command_handler, output_command, span)
+
+        return self.run_output_command_handler(output_command, span)
+
+    def init_output_commands(self, commands, compile_command):
+        by_name = {}
+        by_label = {}
+
+        for command in commands:
+            name = command.get('Name', '').strip()
+            if name in by_name:
+                raise exceptions.FxConfigException(f'{self.module_id} output command "{name}" is defined more than once.', fatal=True)
+
+            compiled = compile_command(command)
+            by_name[name] = compiled
+
+            label = self.output_command_label(command)
+            if label in by_label:
+                logging.warning(f'{self.module_id} output command "{name}" has the same label "{label}" as an earlier one, manual send keeps the first.')
+                continue
+
+            by_label[label] = compiled
+
+        self.output_commands = MappingProxyType(by_name)
+        self.output_command_labels = MappingProxyType(by_label)
+
+    def output_command_label(self, command):
+        return f"{self.module_id}: {command.get('Text', 'Unnamed')}"
+
+    def run_output_command_handler(self, output_command, span=None):
+        command = self.output_commands.get(output_command, None)
+        if command is None:
+            logging.error(f'{self.module_id} has no output command named "{output_command}"')
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
+            if span is not None:
+                self.parent.latency.record(span, False)
+            return False
+
+        if span is None:
+            return self.send(command)
 
-        self.run_output_command_handler(output_command)
+        span.due = time.monotonic()
+        result = self.send(command)
 
-    def run_output_command_handler(self, output_command):
+        # Deferred sends are timed from their completion, not from here
+        self.parent.latency.finish(span, result)
+        return result
+
+    def manual_send_callback(self, label):
+        command = self.output_command_labels.get(label, None)
+        if command is None:
+            return False
+
+        return self.send(command)
+
+    def send(self, command):
         pass
 
+    def target_stats(self):
+        # Output modules return their ConnectionStats by target name
+        return {}
+
     def cleanup(self):
         pass
 
@@ -204,35 +382,183 @@ class SubThreadBase(ThreadBase, Thread):
         self.cleanup()
         self.exit = True
 
+class Waker():
+    """
+    Self-pipe registered in a selector, lets other threads interrupt a
+    select() that is waiting on sockets when they queue work.
+
+    """
+
+    reader: socket.socket = None
+    writer: socket.socket = None
+
+    # Set while a wake byte is in flight, saves a syscall per put
+    pending: bool = False
+
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+        self.writer.setblocking(False)
+        self.pending = False
+
+    def wake(self):
+        if self.pending:
+            return
+
+        self.pending = True
+        try:
+            self.writer.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            # Closed during shutdown
+            pass
+
+    def drain(self, sock=None):
+        try:
+            while self.reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        # Cleared after draining, the queue is always drained after this
+        self.pending = False
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+class SelectorThreadBase(SubThreadBase):
+    """
+    Subthread that blocks in a single selector wait on its sockets, its
+    queue (through a Waker) and its scheduler deadlines. Registered sockets
+    carry their handler as selector data, called with the socket object.
+
+    """
+
+    selector: selectors.BaseSelector = None
+    waker: Waker = None
+
+    def __init__(self, *args, **kwargs):
+        self.selector = selectors.DefaultSelector()
+        self.waker = Waker()
+        self.selector.register(self.waker.reader, selectors.EVENT_READ, self.waker.drain)
+
+        super(SelectorThreadBase, self).__init__(*args, **kwargs)
+
+    def wake(self):
+        self.waker.wake()
+
+    def wait_for_queue(self):
+        # Work queued while busy goes first, then sleep on sockets and queue alike
+        if self.drain_queue() or self.exit:
+            return True
+
+        timeout = self.scheduler.next_timeout(self.queue_timeout)
+        for key, _ in self.selector.select(timeout):
+            handler = key.data
+            handler(key.fileobj)
+
+        return False
+
+    def unregister(self, sock):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def connection_option(self, settings, key):
+        # Per connection settings override the module wide ones
+        return settings.get(key, self.config.get(key, None))
+
+    def create_connection(self, name, hostname, port, protocol, settings, **kwargs):
+        """
+        PersistentConnection on this thread with its timeouts, reconnect
+        backoff, buffering and probing taken from settings, the config block
+        of the target. kwargs are passed on, e.g. callbacks and probe_payload.
+
+        """
+        option = lambda key: self.connection_option(settings, key)
+
+        try:
+            return PersistentConnection(
+                self, name, hostname, port, protocol,
+                connect_timeout=option('Timeout'),
+                backoff_min=option('ReconnectMin'),
+                backoff_max=option('ReconnectMax'),
+                buffer_size=option('BufferSize'),
+                buffer_timeout=option('BufferTimeout'),
+                probe_interval=option('ProbeInterval'),
+                **kwargs,
+            )
+        except socket.gaierror as e:
+            raise exceptions.FxConfigException(f'{name} hostname error', e, fatal=True)
+
+    def report_connections(self, connections):
+        # Running with every target up, Warning with some, Error with none
+        connections = tuple(connections)
+        connected = sum(1 for c in connections if c.connected)
+
+        if connected == len(connections):
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
+        elif connected > 0:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning | ModuleStatus.KeepActivity)
+        else:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error | ModuleStatus.KeepActivity)
+
+    def cleanup(self):
+        self.selector.close()
+        self.waker.close()
+
+
+# Guards the lazy creation of FxQueueItem futures against their completion
+_future_lock = Lock()
+
 class FxQueueItem():
-    # Class of target thread
-    target: ThreadBase.__class__ = None
+    """
+    A call queued on a target thread. It doubles as a handle to its
+    outcome with the concurrent.futures.Future interface; the actual Future
+    is only created when somebody asks for it.
 
-    # Object of sender
-    sender: object = None
-    auto_add_queue_sender: bool = False
+    """
 
-    # Callback
-    callback = None
+    __slots__ = ('target', 'method', 'args', 'kwargs', 'callback', 'started', 'finished', 'outcome', 'failure', 'future')
 
-    # str of target thread's class method
-    method: str = None
+    # Target thread
+    target: ThreadBase
 
-    args: list = []
-    kwargs: dict = {}
+    # Name of the target thread's method, or a bound callable
+    method: object
 
-    def __init__(self, target_class, method):
-        self.target = target_class
-        self.method = method
+    args: tuple
+    kwargs: dict
 
-    def __str__(self):
-        return f'<FxQueueItem for={self.target.__name__} method={self.method} args={self.args} kwargs={self.kwargs}>'
+    # Callback
+    callback: object
 
-    def set_sender(self, sender, auto_add_queue_sender=False):
-        self.sender = sender
-        self.auto_add_queue_sender = auto_add_queue_sender
+    # Running state and outcome, kept until a Future is requested
+    started: bool
+    finished: bool
+    outcome: object
+    failure: BaseException
+    future: Future
 
-        return self
+    def __init__(self, target, method):
+        self.target = target
+        self.method = method
+        self.args = ()
+        self.kwargs = {}
+        self.callback = None
+        self.started = False
+        self.finished = False
+        self.outcome = None
+        self.failure = None
+        self.future = None
+
+    def __str__(self):
+        method = self.method if type(self.method) is str else getattr(self.method, '__qualname__', self.method)
+        return f'<FxQueueItem for={self.target.name} method={method} args={self.args} kwargs={self.kwargs}>'
 
     def attach_callback(self, callback):
         self.callback = callback
@@ -246,7 +572,140 @@ class FxQueueItem():
         return self.run()
 
     def run(self):
-        if self.auto_add_queue_sender:
-            self.sender.queue.put(self)
+        if not self.target.dispatcher.dispatch(self):
+            self.set_exception(exceptions.FxInternalException(f'{self.target.name} is not accepting work'))
+
+        return self
+
+    # Producer side, called by the target thread
+
+    def set_running(self):
+        with _future_lock:
+            future = self.future
+            if future is None:
+                # A Future created later starts out running, it can no longer be cancelled
+                self.started = True
+                return True
+
+        return future.set_running_or_notify_cancel()
+
+    @staticmethod
+    def settle_future(future, setter, value):
+        if future is None:
+            return
+
+        try:
+            setter(future, value)
+        except InvalidStateError:
+            # Cancelled before it ran, nobody is waiting for the outcome
+            pass
+
+    def set_result(self, result):
+        with _future_lock:
+            self.finished = True
+            self.outcome = result
+            future = self.future
+
+        self.settle_future(future, Future.set_result, result)
+
+        if self.callback is not None:
+            logging.debug(f'{self} forwarding result to callback function {self.callback}')
+            self.callback(result)
+
+    def set_exception(self, exception):
+        with _future_lock:
+            self.finished = True
+            self.failure = exception
+            future = self.future
+
+        self.settle_future(future, Future.set_exception, exception)
+
+    def follow(self, other):
+        other.add_done_callback(lambda done: forward_outcome(done, self.set_result, self.set_exception))
+
+    # Consumer side, the concurrent.futures.Future interface
+
+    def get_future(self):
+        with _future_lock:
+            if self.future is None:
+                self.future = Future()
+                if self.started or self.finished:
+                    self.future.set_running_or_notify_cancel()
+
+                if self.finished:
+                    if self.failure is not None:
+                        self.future.set_exception(self.failure)
+                    else:
+                        self.future.set_result(self.outcome)
+
+            return self.future
+
+    def done(self):
+        future = self.future
+        return self.finished or (future is not None and future.done())
+
+    def running(self):
+        return self.get_future().running()
+
+    def cancel(self):
+        return self.get_future().cancel()
+
+    def cancelled(self):
+        return self.get_future().cancelled()
+
+    def result(self, timeout=None):
+        return self.get_future().result(timeout)
+
+    def exception(self, timeout=None):
+        return self.get_future().exception(timeout)
+
+    def add_done_callback(self, fn):
+        return self.get_future().add_done_callback(fn)
+
+
+def forward_outcome(done, set_result, set_exception):
+    """
+    Pass the outcome of the settled future done on to another one.
+
+    """
+    if done.cancelled():
+        set_exception(CancelledError())
+    elif (exception := done.exception()) is not None:
+        set_exception(exception)
+    else:
+        set_result(done.result())
+
+
+def wait_for(handles, timeout=None, return_when='ALL_COMPLETED'):
+    """
+    concurrent.futures.wait() for FxQueueItems and Futures alike.
+
+    """
+    futures = [ h.get_future() if isinstance(h, FxQueueItem) else h for h in handles ]
+    return wait(futures, timeout=timeout, return_when=return_when)
+
+
+def when_all(handles, callback):
+    """
+    Call callback(handles) once every handle has settled, without blocking.
+    It runs on the thread that settles the last handle.
+
+    """
+    handles = list(handles)
+    if len(handles) <= 0:
+        callback(handles)
+        return
+
+    lock = Lock()
+    remaining = [len(handles)]
+
+    def settled(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+
+        if last:
+            callback(handles)
 
-        return self
\ No newline at end of file
+    for handle in handles:
+        handle.add_done_callback(settled)
\ No newline at end of file
@@ -0,0 +1,102 @@
+import logging
+import threading
+from queue import Empty
+
+import exceptions
+from helpers.counter import AtomicCounter
+from helpers.latency import LatencyHistogram
+
+class DispatchStats():
+
+    __slots__ = ('queued', 'delivered', 'dropped', 'busy')
+
+    def __init__(self):
+        self.queued = AtomicCounter()
+        self.delivered = AtomicCounter()
+        self.dropped = AtomicCounter()
+
+        # Time spent running each delivered item, written by the target thread only
+        self.busy = LatencyHistogram()
+
+    def __str__(self):
+        return f'<DispatchStats queued={self.queued} delivered={self.delivered} dropped={self.dropped}>'
+
+
+class Dispatcher():
+    """
+    Routes FxQueueItems straight into the queue of the thread they target.
+    Items for a thread that is not registered or already exiting
+    are counted as dropped and logged, never silently discarded.
+
+    """
+
+    # Target thread -> DispatchStats
+    routes: dict = None
+
+    # Threads that stopped consuming, their routes only keep the counters
+    closed: set = None
+
+    # Orders puts against close(), nothing lands in a queue after it was drained
+    lock: threading.Lock = None
+
+    def __init__(self):
+        self.routes = {}
+        self.closed = set()
+        self.lock = threading.Lock()
+
+    def register(self, thread):
+        stats = DispatchStats()
+        self.routes[thread] = stats
+        thread.dispatch_stats = stats
+
+    def close(self, thread):
+        """
+        Fail whatever was queued after the thread stopped consuming, so
+        nobody waits on it forever. The route is kept so its counters stay
+        available.
+
+        """
+        stats = self.routes.get(thread, None)
+        if stats is None:
+            return
+
+        left = []
+        with self.lock:
+            self.closed.add(thread)
+            while True:
+                try:
+                    left.append(thread.queue.get_nowait())
+                except Empty:
+                    break
+
+        if len(left) <= 0:
+            return
+
+        stats.dropped.increment(len(left))
+        logging.warning(f'{len(left)} queued item(s) for {thread.name} dropped on exit')
+
+        # Outside the lock, done callbacks may dispatch again
+        for item in left:
+            item.set_exception(exceptions.FxInternalException(f'{thread.name} exited before running the call'))
+
+    def dispatch(self, item):
+        thread = item.target
+        stats = self.routes.get(thread, None)
+
+        with self.lock:
+            accepted = stats is not None and not thread.exit and thread not in self.closed
+            if accepted:
+                thread.queue.put(item)
+
+        if not accepted:
+            if stats is not None:
+                stats.dropped.increment()
+            logging.warning(f'Dropped {item}, target thread is not accepting work')
+            return False
+
+        stats.queued.increment()
+        thread.wake()
+        return True
+
+    def stats(self):
+        return { thread.name: stats for thread, stats in self.routes.items() }
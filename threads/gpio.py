@@ -1,16 +1,19 @@
 import socket
+import selectors
 import logging
-import ipaddress
+import time
+from concurrent.futures import Future
 
 from helpers import Map
+from helpers.matcher import PayloadMatcher
+from helpers.whitelist import IPWhitelist
+from helpers.ratelimit import RateLimiter, Debouncer, SuppressionStats
 from helpers.enum import ModuleStatus, ModuleIOType
-from threads import SubThreadBase
-
-from ui.gpio import GPOManualSendWindow
+from threads import SelectorThreadBase, when_all
 
 import exceptions
 
-class GPIOThread(SubThreadBase):
+class GPIOThread(SelectorThreadBase):
     socket = None
     config = {}
 
@@ -25,7 +28,6 @@ class GPIOThread(SubThreadBase):
 
         self.init_address()
         self.init_gpio_commands()
-        self.init_socket()
 
     def init_address(self):
         if self.module_id == 'GPI':
@@ -36,6 +38,9 @@ class GPIOThread(SubThreadBase):
         self.address['port'] = self.config.get('Port', 0)
         self.address['protocol'] = self.config.get('Protocol', '')
 
+        if self.address.protocol not in ('tcp', 'udp'):
+            raise exceptions.FxConfigException(f'Protocol "{self.address.protocol}" not supported.', fatal=True)
+
     def init_gpio_commands(self):
         for gpio_commands in self.config.get('OutputCommands', []):
 
@@ -62,229 +67,589 @@ class GPIOThread(SubThreadBase):
             raise exceptions.FxNetworkException(f'Error creating socket', e, fatal=True)
 
         # Check ip validity in whitelist
-        whitelist_str = self.config.get('AllowedIP', [])
-        self.address['whitelist'] = []
-        for addr_str in whitelist_str:
-            try:
-                self.address.whitelist.append(ipaddress.IPv4Network(addr_str))
-                logging.debug(f'{self.module_id} whitelist address valid: {addr_str}')
-            except (ValueError, ipaddress.AddressValueError) as e:
-                raise exceptions.FxConfigException(f'{self.module_id} whitelist address invalid: {addr_str}', e, fatal=True)
+        self.address['whitelist'] = IPWhitelist(self.module_id, self.config.get('AllowedIP', []))
 
     def cleanup(self):
-        self.socket.close()
+        if self.socket is not None:
+            self.socket.close()
+
+        super(GPIOThread, self).cleanup()
         
 
+class GPIConnection():
+
+    sock: socket.socket = None
+    addr: tuple = None
+
+    # Bytes received but not yet terminated by a separator
+    buffer: bytearray = None
+
+    last_activity: float = None
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.buffer = bytearray()
+        self.last_activity = time.monotonic()
+
+    def __str__(self):
+        return f'<GPIConnection tcp://{self.addr[0]}:{self.addr[1]} buffered={len(self.buffer)}>'
+
+    def take_frames(self, separator):
+        """
+        Cut every complete frame off the receive buffer and return them as
+        one chunk ending on a separator, or None when no frame is complete.
+        The trailing partial frame stays buffered for the next read.
+
+        """
+        end = self.buffer.rfind(separator)
+        if end < 0:
+            return None
+
+        end += len(separator)
+        frames = bytes(self.buffer[:end])
+        del self.buffer[:end]
+
+        return frames
+
+    def take_remainder(self):
+        remainder = bytes(self.buffer)
+        self.buffer.clear()
+        return remainder
+
+
+class GPIInputCommand():
+
+    payload: str = None
+    actions: tuple = ()
+
+    def __init__(self, payload, actions):
+        self.payload = payload
+        self.actions = actions
+
+    def __str__(self):
+        return f'<GPIInputCommand payload="{self.payload}" actions={len(self.actions)}>'
+
+
 class GPIThread(GPIOThread):
 
     module_io_type: ModuleIOType = ModuleIOType.Input
 
-    queue_blocking: bool = False
-    queue_rate: int = 2 # Hz
-
-    conn_backlogs: int = 4
+    conn_backlogs: int = 16
     recv_buffer: int = 1024
+    datagram_buffer: int = 65535
+
+    # Drop a connection buffering more than this without a separator
+    max_frame_size: int = 65536
+
+    # Idle connection reaping, only armed while connections are open
+    sweep_interval: float = 1 # sec
+    sweep = None
+
+    keep_open: bool = False
+    idle_timeout: float = 0
+
+    encoding: str = 'utf-8'
+    separator: str = None
+    separator_bytes: bytes = None
+
+    # Payload -> GPIInputCommand, compiled once at init
+    input_matcher: PayloadMatcher = None
+
+    connections: dict = None
+
+    # Senders turned away by the whitelist, reported at most once per interval
+    rejected: int = 0
+    rejected_logged: int = 0
+    rejected_logged_at: float = float('-inf')
+    reject_log_interval: float = 5 # sec
+
+    # Commands parsed out of received data, and how many of them matched an input command
+    commands_received: int = 0
+    commands_matched: int = 0
+    commands_unmatched: int = 0
+
+    # Trigger storm protection, all disabled unless configured
+    source_limiter: RateLimiter = None
+    command_limiter: RateLimiter = None
+    debouncer: Debouncer = None
+    suppressed: SuppressionStats = None
 
     def init(self):
-        super(GPIThread, self).init()
+        self.connections = {}
 
-        # TODO: Implement keep open listener
-        if self.config.get('KeepOpen', False):
-            raise exceptions.FxConfigException('GPI option "KeepOpen" is not implemented this version.', fatal=True)
+        super(GPIThread, self).init()
 
+        self.init_socket()
+        self.init_framing()
+        self.init_input_commands()
+        self.init_rate_limits()
         self.listen()
 
+    def init_input_commands(self):
+        self.input_matcher = PayloadMatcher()
+
+        for inp_cmd in self.config.get('InputCommands', []):
+            payload = inp_cmd.get('Payload', None)
+            if payload is None or len(payload.strip()) == 0:
+                raise exceptions.FxConfigException('GPI input command "Payload" must not be empty.', fatal=True)
+
+            actions = inp_cmd.get('Actions', [])
+            if type(actions) is not list:
+                raise exceptions.FxConfigException(f'GPI input command "{payload}" "Actions" must be a list.', fatal=True)
+
+            command = GPIInputCommand(payload.strip(), tuple(actions))
+            self.input_matcher.add(command.payload, command, inp_cmd.get('Match', 'Exact'))
+
+        self.input_matcher.compile()
+        logging.debug(f'GPI compiled {len(self.input_matcher)} input command(s)')
+
+    def init_framing(self):
+        self.encoding = self.config.get('Encoding', 'utf-8')
+        self.separator = self.config.get('Separator', None) or None
+        self.separator_bytes = self.separator.encode(self.encoding) if self.separator is not None else None
+
+        self.keep_open = self.config.get('KeepOpen', False) is True
+        if self.keep_open:
+            if self.address.protocol != 'tcp':
+                raise exceptions.FxConfigException('GPI option "KeepOpen" requires protocol "tcp".', fatal=True)
+
+            if self.separator_bytes is None:
+                raise exceptions.FxConfigException('GPI option "KeepOpen" requires a "Separator".', fatal=True)
+
+        # Persistent sessions idle forever by default, one-shot connections get a few seconds
+        self.idle_timeout = float(self.config.get('IdleTimeout', 0 if self.keep_open else 5))
+
+    def init_rate_limits(self):
+        # Rates in triggers per sec, bursts default to one second worth of triggers
+        self.source_limiter = RateLimiter(self.config.get('SourceRateLimit', 0), self.config.get('SourceBurst', None))
+        self.command_limiter = RateLimiter(self.config.get('CommandRateLimit', 0), self.config.get('CommandBurst', None))
+
+        # Identical payloads inside the window count as one trigger
+        self.debouncer = Debouncer(self.config.get('DebounceWindow', 0))
+
+        self.suppressed = SuppressionStats()
+
+    def resolve_actions(self, actions):
+        unknown = []
+        for command in self.input_matcher.values():
+            command.actions, missing = actions.resolve(command.actions)
+            unknown += [f'"{name}" (payload "{command.payload}")' for name in missing]
+
+        if len(unknown) > 0:
+            raise exceptions.FxConfigException(f'GPI input commands reference unknown action(s): {", ".join(unknown)}.')
+
     def listen(self):
-        # TODO: Add Error handling
         address = self.address.hostname
         port = self.address.port
         protocol = self.address.protocol
 
-        logging.info(f'Listening for GPI on {protocol}://{address}:{port}')
-        
-        sock_timeout = 1 / self.queue_rate if self.queue_rate != 0 else 0
-        self.socket.settimeout(sock_timeout)
+        logging.info(f'Listening for GPI on {protocol}://{address}:{port}' + (' (KeepOpen)' if self.keep_open else ''))
 
-        self.queue_rate = 0
-        self.queue_cooldown = 0
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.setblocking(False)
+            self.socket.bind((address, port))
 
-        self.socket.bind((address, port))
+            if protocol == 'tcp':
+                self.socket.listen(self.conn_backlogs)
+                self.selector.register(self.socket, selectors.EVENT_READ, self.accept)
+            elif protocol == 'udp':
+                self.selector.register(self.socket, selectors.EVENT_READ, self.receive_datagram)
 
-        if protocol == 'tcp':
-            self.socket.listen(self.conn_backlogs)
+        except socket.error as e:
+            raise exceptions.FxNetworkException(f'GPI cannot listen on {protocol}://{address}:{port}', e, fatal=True)
 
         self.initialized = True
 
-    def receive(self):
-        pass
-
     def sender_whitelisted(self, addr):
-        conn_uri = f'{self.address.protocol}://{addr[0]}:{addr[1]}'
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'New GPI connection from {self.address.protocol}://{addr[0]}:{addr[1]}')
 
-        logging.debug(f'New GPI connection from {conn_uri}')
-        addr_net = ipaddress.IPv4Network(addr[0])
+        return self.address.whitelist.allows(addr[0])
 
-        for subnet in self.address.whitelist:
-            if subnet.supernet_of(addr_net):
-                return True
+    def reject_sender(self, addr, message):
+        self.rejected += 1
 
-        return False
+        # A flooding sender must not flood the log and the UI as well
+        now = time.monotonic()
+        if now - self.rejected_logged_at < self.reject_log_interval:
+            return
+
+        suppressed = self.rejected - self.rejected_logged - 1
+        self.rejected_logged = self.rejected
+        self.rejected_logged_at = now
+
+        self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
+        logging.warning(f'{message} {self.address.protocol}://{addr[0]}:{addr[1]}, not on whitelist!' + (f' ({suppressed} more since last report)' if suppressed > 0 else ''))
+
+    def accept(self, sock):
+        # Drain the whole backlog, many senders may connect at once
+        while True:
+            try:
+                conn, addr = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except socket.error as e:
+                logging.error(f'GPI cannot accept connection: {e}')
+                return
+
+            if not self.sender_whitelisted(addr):
+                conn.close()
+                self.reject_sender(addr, 'Rejected GPI connection from')
+                continue
+
+            conn.setblocking(False)
+            if self.keep_open:
+                # Let the kernel detect peers that vanished without a FIN
+                conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+            self.connections[conn] = GPIConnection(conn, addr)
+            self.selector.register(conn, selectors.EVENT_READ, self.receive)
+
+            if self.idle_timeout > 0 and self.sweep is None:
+                self.sweep = self.scheduler.call_later(self.sweep_interval, self.reap_idle_connections)
+
+    def receive(self, conn):
+        connection = self.connections.get(conn, None)
+        if connection is None:
+            self.close_connection(conn)
+            return
 
-    def tick(self):
         try:
-            if self.address.protocol == 'tcp':
-                conn, addr = self.socket.accept()
-
-                if type(conn) is socket.socket and type(addr) is tuple:
-                    if self.sender_whitelisted(addr):
-                        data = conn.recv(self.recv_buffer)
-                        if data:
-                            self.process_command(data)
-                        else:
-                            conn.close()
-                    else:
-                        conn.close()
-                        self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
-                        logging.warning(f'Rejected GPI connection from tcp://{addr[0]}:{addr[1]}, not on whitelist!')
-
-            elif self.address.protocol == 'udp':
-                # TODO: Recv more than buffer 1024
-                data, addr = self.socket.recvfrom(self.recv_buffer)
-
-                if len(data) > 0 and type(addr) is tuple:
-                    if self.sender_whitelisted(addr):
-                        self.process_command(data)
-                    else:
-                        self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
-                        logging.warning(f'Ignored GPI command from udp://{addr[0]}:{addr[1]}, not on whitelist!')
-
-        except socket.timeout:
+            data = conn.recv(self.recv_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error as e:
+            logging.warning(f'GPI connection error on {connection}: {e}')
+            self.close_connection(conn)
             return
 
-    def parse_command(self, gpi_data):
-        encoding = self.config.get('Encoding', 'utf-8')
-        separator = self.config.get('Separator', None)
+        if not data:
+            # Peer closed, whatever is left is its last command
+            remainder = connection.take_remainder()
+            if remainder:
+                self.process_command(remainder, connection.addr, time.monotonic())
+
+            self.close_connection(conn)
+            return
+
+        received = connection.last_activity = time.monotonic()
 
-        gpi_cmds = gpi_data.decode(encoding)
+        if self.separator_bytes is None:
+            # Without framing every read is a single command
+            self.process_command(data, connection.addr, received)
+            self.close_connection(conn)
+            return
+
+        # Frames may span reads on any connection, one-shot senders included.
+        # An unterminated last command is taken on EOF or when the connection
+        # is reaped after IdleTimeout.
+
+        connection.buffer += data
+        frames = connection.take_frames(self.separator_bytes)
+        if frames is not None:
+            self.process_command(frames, connection.addr, received)
+
+        if len(connection.buffer) > self.max_frame_size:
+            logging.warning(f'Dropping GPI connection {connection}, no separator within {self.max_frame_size} bytes!')
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
+            self.close_connection(conn)
+            return
+
+    def receive_datagram(self, sock):
+        # Drain every pending datagram before going back to the selector
+        while True:
+            try:
+                data, addr = sock.recvfrom(self.datagram_buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except socket.error as e:
+                logging.warning(f'GPI receive error: {e}')
+                return
+
+            if len(data) <= 0:
+                continue
+
+            received = time.monotonic()
+            if self.sender_whitelisted(addr):
+                self.process_command(data, addr, received)
+            else:
+                self.reject_sender(addr, 'Ignored GPI command from')
 
-        if separator in gpi_cmds:
-            return gpi_cmds.split(separator)
+    def reap_idle_connections(self):
+        now = time.monotonic()
+        for conn, connection in list(self.connections.items()):
+            if now - connection.last_activity >= self.idle_timeout:
+                logging.info(f'Closing idle GPI connection {connection}')
+
+                # An unterminated last command still counts
+                remainder = connection.take_remainder()
+                if remainder:
+                    self.process_command(remainder, connection.addr, now)
+
+                self.close_connection(conn)
+
+        self.sweep = None
+        if len(self.connections) > 0:
+            self.sweep = self.scheduler.call_later(self.sweep_interval, self.reap_idle_connections)
+
+    def close_connection(self, conn):
+        self.connections.pop(conn, None)
+        self.unregister(conn)
+        conn.close()
+
+    def cleanup(self):
+        for conn in list(self.connections):
+            self.close_connection(conn)
+
+        super(GPIThread, self).cleanup()
+
+    def parse_command(self, gpi_data):
+        gpi_cmds = gpi_data.decode(self.encoding, errors='replace')
+
+        if self.separator is not None and self.separator in gpi_cmds:
+            return gpi_cmds.split(self.separator)
         
         return [gpi_cmds]
         
-    def process_command(self, gpi_data):
-        inp_cmds = self.config.get('InputCommands', [])
+    def trigger_allowed(self, gpi_cmd, run_cmd, addr, now):
+        # Debounce first, repeats must not use up the sender's tokens
+        if not self.debouncer.allow(gpi_cmd, now):
+            self.suppressed.debounced += 1
+            reason = 'debounced'
+        elif not self.source_limiter.allow(addr[0], now):
+            self.suppressed.source += 1
+            reason = f'rate limited for {addr[0]}'
+        elif not self.command_limiter.allow(run_cmd, now):
+            self.suppressed.command += 1
+            reason = 'rate limited for the command'
+        else:
+            return True
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'GPI suppressed command "{gpi_cmd}", {reason} ({int(self.suppressed)} suppressed so far)')
+
+        return False
+
+    def process_command(self, gpi_data, addr, received=None):
+        """
+        Resolves every command in a received chunk into one deduplicated
+        batch of actions, queued on the main thread once. The batch carries
+        a latency trace starting at received, the monotonic time of the read.
+
+        """
         gpi_cmds = self.parse_command(gpi_data)
+        now = time.monotonic()
+
+        # Action -> None, keeps the first-seen order
+        batch = {}
+        matched = 0
+        rejected = 0
 
         for gpi_cmd in gpi_cmds:
             gpi_cmd = gpi_cmd.strip()
             if len(gpi_cmd) <= 0:
                 continue
 
-            run_cmd = None
-            for inp_cmd in inp_cmds:
-                if inp_cmd.get('Payload', None) == gpi_cmd:
-                    run_cmd = inp_cmd
-                    break
+            self.commands_received += 1
+            run_cmd = self.input_matcher.match(gpi_cmd)
 
-            if run_cmd is not None:
-                actions = run_cmd.get('Actions', [])
-                logging.info(f'GPI received command: "{run_cmd.get("Payload", None)}", running {len(actions)} action(s)...')
+            if run_cmd is None:
+                self.commands_unmatched += 1
+                rejected += 1
+                continue
 
-                for action in actions:
-                    self.parent.run_action_later(action)
+            self.commands_matched += 1
+            if not self.trigger_allowed(gpi_cmd, run_cmd, addr, now):
+                rejected += 1
+                continue
 
-                self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
+            matched += 1
+            batch.update(dict.fromkeys(run_cmd.actions))
 
-            else:
-                self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
+            logging.info(f'GPI received command: "{gpi_cmd}", running {len(run_cmd.actions)} action(s)...')
+
+        if len(batch) > 0:
+            trace = self.parent.latency.trace(self.module_id, received, now) if received is not None else None
+            self.parent.run_actions_later(tuple(batch), trace=trace)
+
+        if rejected > 0:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
+        elif matched > 0:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
+
+
+class GPOOutputCommand():
+
+    name: str = None
+    frame: bytes = None
+
+    # Target connections this command goes to
+    targets: tuple = ()
+
+    def __init__(self, name, frame, targets):
+        self.name = name
+        self.frame = frame
+        self.targets = targets
+
+    def __str__(self):
+        return f'<GPOOutputCommand {self.name} targets={len(self.targets)}>'
 
 
 class GPOThread(GPIOThread):
 
     module_io_type: ModuleIOType = ModuleIOType.Output
 
+    encoding: str = 'utf-8'
+    separator_bytes: bytes = b''
+
+    # Target name -> PersistentConnection
+    targets: dict = None
+
     def init(self):
         super(GPOThread, self).init()
 
-        self.connect()
+        self.init_framing()
+        self.init_targets()
+        self.init_output_commands(self.config.get('OutputCommands', []), self.compile_output_command)
+
+        # Usable while peers are down, sends are buffered until they come back
+        self.initialized = True
+
+    def init_framing(self):
+        self.encoding = self.config.get('Encoding', 'utf-8')
+        self.separator_bytes = self.config.get('Separator', '').encode(self.encoding)
+
+    def init_targets(self):
+        self.targets = {}
+
+        target_list = self.config.get('Targets', None)
+        if target_list is None:
+            # Single target configured on the module itself
+            target_list = [{
+                'Name': self.module_id,
+                'Hostname': self.address.hostname,
+                'Port': self.address.port,
+            }]
+
+        if len(target_list) <= 0:
+            raise exceptions.FxConfigException('GPO requires at least one target.', fatal=True)
+
+        for target in target_list:
+            name = target.get('Name', '').strip()
+            if len(name) <= 0:
+                raise exceptions.FxConfigException('GPO target requires a "Name" property.', fatal=True)
+
+            if name in self.targets:
+                raise exceptions.FxConfigException(f'GPO target "{name}" is defined more than once.', fatal=True)
+
+            self.targets[name] = self.init_connection(name, target)
+
+    def init_connection(self, name, target):
+        address = target.get('Hostname', '')
+        port = target.get('Port', self.address.port)
+        protocol = target.get('Protocol', self.address.protocol)
+
+        if protocol not in ('tcp', 'udp'):
+            raise exceptions.FxConfigException(f'GPO target "{name}" protocol "{protocol}" not supported.', fatal=True)
+
+        logging.info(f'GPO target "{name}" will send on {protocol}://{address}:{port}')
+
+        probe = self.connection_option(target, 'ProbePayload')
+
+        return self.create_connection(
+            f'GPO[{name}]', address, port, protocol, target,
+            on_state=self.connection_state_changed,
+            probe_payload=self.frame_payload(probe) if probe is not None else None,
+        )
+
+    def compile_output_command(self, command):
+        name = command.get('Name').strip()
+
+        target_names = command.get('Targets', None)
+        if target_names is None:
+            targets = tuple(self.targets.values())
+        else:
+            unknown = [ t for t in target_names if t not in self.targets ]
+            if len(unknown) > 0:
+                raise exceptions.FxConfigException(f'GPO output command "{name}" refers to unknown target(s): {", ".join(unknown)}.', fatal=True)
+
+            targets = tuple(self.targets[t] for t in target_names)
+
+        return GPOOutputCommand(name, self.frame_payload(command.get('Payload')), targets)
+
+    def frame_payload(self, payload):
+        if type(payload) is str:
+            payload = payload.encode(self.encoding)
+
+        return payload + self.separator_bytes
 
     def show_manual_send_window(self):
-        commands = self.config.get('OutputCommands', [])
+        from ui.gpio import GPOManualSendWindow
+
         data = {
-            'cmd_list': [ f"{self.module_id}: {cmd.get('Text', 'Unnamed')}" for cmd in commands ],
+            'cmd_list': list(self.output_command_labels),
             'callback_safe': self.run_later('manual_send_callback').with_args
         } 
 
         self.parent.UI.create_window_later(GPOManualSendWindow, user_data=data)
 
-    def manual_send_callback(self, val):
-        commands = self.config.get('OutputCommands', [])
-        payload = None
-        for command in commands:
-            if '{}: {}'.format(self.module_id, command['Text']) == val:
-                payload = command.get('Payload', None)
-                break
-    
-        if payload is not None:
-            self.send(payload)
+    def pre_start(self):
+        for connection in self.targets.values():
+            connection.open()
 
-        # self.show_manual_send_window()
+    def connection_state_changed(self, connection, error):
+        self.report_connections(self.targets.values())
 
-    def connect(self):
-        address = self.address.hostname
-        port = self.address.port
-        protocol = self.address.protocol
+    def send(self, data):
+        if data is None:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
+            return False
 
-        logging.info(f'GPO will send on {protocol}://{address}:{port}')
+        if type(data) is GPOOutputCommand:
+            frame = data.frame
+            targets = data.targets
+        else:
+            # Raw payloads go to every target, strings get framed here
+            frame = self.frame_payload(data) if type(data) is str else data
+            targets = tuple(self.targets.values())
 
-        try:
-            self.socket.settimeout(self.config.get('Timeout', 2))
-            conn = self.socket.connect((address, port))
-        except socket.gaierror as e:
-            raise exceptions.FxConfigException(f'GPO hostname error', e, fatal=True)
-        except socket.error as e:
-            # raise exceptions.FxNetworkException(f'GPO connection error', e)
-            # TODO: Show messagebox
-            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error | ModuleStatus.KeepActivity)
-            logging.error(f'GPO connection error: {e}')
-            return False
+        # Non-blocking writes, no target waits on another
+        results = [ connection.send(frame) for connection in targets ]
 
-        self.initialized = True
-        return conn
+        deferred = []
+        failed = 0
+        for connection, result in zip(targets, results):
+            if result is False:
+                failed += 1
+                logging.error(f'{connection.name} cannot send data: {frame}')
+            elif result is not True:
+                deferred.append(result)
 
-    def run_output_command_handler(self, output_command):
-        # TODO: Make more efficient
-        commands = self.config.get('OutputCommands', [])
-        for command in commands:
-            if command.get('Name', '') == output_command:
-                self.send(command.get('Payload', None))
-                break
+        logging.info(f'GPO sent data: {frame} to {len(targets) - failed - len(deferred)}/{len(targets)} target(s)')
 
-    def send(self, data):
-        if self.socket is None:
+        if failed == len(targets):
             self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
-            return False
+        elif failed > 0 or len(deferred) > 0:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
+        else:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
 
-        if data is None:
-            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
-            return False
+        if len(deferred) <= 0:
+            return failed == 0
 
-        encoding = self.config.get('Encoding', 'utf-8')
-        separator = self.config.get('Separator', '').encode(encoding)
+        # Settles once every buffered frame went out or was discarded
+        combined = Future()
+        combined.set_running_or_notify_cancel()
+        when_all(deferred, lambda done: combined.set_result(failed == 0 and all(f.result() for f in done)))
+        return combined
 
-        if type(data) is str:
-            data = data.encode(encoding)
-        
-        try:
-            logging.info(f'GPO sent data: {data}')
-            self.socket.send(data + separator)
-            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
-        except socket.error as e:
-            # raise exceptions.FxNetworkException(f'Error sending data', e)
-            # TODO: Show messagebox
-            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
-            logging.error(f'GPO cannot send data: {e}')
-            return False
+    def target_stats(self):
+        return { name: connection.stats for name, connection in self.targets.items() }
+
+    def cleanup(self):
+        for connection in (self.targets or {}).values():
+            connection.close()
 
-        return True
\ No newline at end of file
+        super(GPOThread, self).cleanup()
\ No newline at end of file
@@ -1,13 +1,100 @@
 import logging
-import ipaddress
-import requests
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
 
-from threads import SubThreadBase
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    # Only HTTPClient sends with requests, the rest runs without it
+    requests = None
+
+from threads import SubThreadBase, forward_outcome
+from threads.transport import ConnectionStats
 
 import exceptions
-from ui.http import HTTPManualSendWindow
+from helpers.matcher import PayloadMatcher
+from helpers.whitelist import IPWhitelist
 from helpers.enum import ModuleStatus, ModuleIOType
 
+class HTTPOutputCommand():
+
+    name: str = None
+    method: str = 'GET'
+    url: str = None
+    payload = None
+
+    # scheme://host:port, selects the pooled session
+    host: str = None
+
+    # (connect, read) in seconds
+    timeout: tuple = None
+
+    # Runs alone on its host, after everything sent before it has finished
+    ordered: bool = False
+
+    def __init__(self, command, default_timeout):
+        self.name = command.get('Name').strip()
+        self.method = command.get('Method', 'GET').upper()
+        self.url = command.get('Url').strip()
+        self.payload = command.get('Payload', None)
+        self.ordered = bool(command.get('Ordered', False))
+
+        url = urlsplit(self.url)
+        if url.scheme not in ('http', 'https') or len(url.netloc) <= 0:
+            raise exceptions.FxConfigException(f'HTTP command "{self.name}" has an invalid URL: {self.url}', fatal=True)
+
+        self.host = f'{url.scheme}://{url.netloc}'
+        self.timeout = self.parse_timeout(command, default_timeout)
+
+    def parse_timeout(self, command, default_timeout):
+        timeout = command.get('Timeout', None)
+        if timeout is None:
+            return (
+                float(command.get('ConnectTimeout', default_timeout[0])),
+                float(command.get('ReadTimeout', default_timeout[1])),
+            )
+
+        if type(timeout) is list:
+            return (float(timeout[0]), float(timeout[1]))
+
+        return (float(timeout), float(timeout))
+
+    def __str__(self):
+        return f'<HTTPOutputCommand {self.name} {self.method} {self.url}>'
+
+
+class HTTPHostLane():
+    """
+    FIFO of requests waiting for one host. At most limit of them run at
+    once, an ordered request waits for the lane to empty and holds it alone.
+
+    """
+
+    __slots__ = ('host', 'limit', 'active', 'exclusive', 'waiting', 'running', 'stats')
+
+    def __init__(self, host, limit):
+        self.host = host
+        self.limit = max(1, limit)
+        self.active = 0
+        self.exclusive = False
+        self.stats = ConnectionStats()
+
+        # (http_command, future)
+        self.waiting = deque()
+
+        # Send future -> pool future of the requests started and not yet done
+        self.running = {}
+
+    def __str__(self):
+        return f'<HTTPHostLane {self.host} active={self.active}/{self.limit} waiting={len(self.waiting)}>'
+
+
 class HTTPThread(SubThreadBase):
     config = {}
 
@@ -33,66 +120,449 @@ class HTTPThread(SubThreadBase):
         pass
         
 
+class HTTPInputRoute():
+
+    path: str = None
+
+    # Method -> tuple of actions
+    actions: dict = None
+
+    def __init__(self, path):
+        self.path = path
+        self.actions = {}
+
+    def __str__(self):
+        return f'<HTTPInputRoute {self.path} methods={",".join(self.actions)}>'
+
+
+class HTTPInputServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 64
+
+    # Owning HTTPServerThread
+    module = None
+
+
+class HTTPInputHandler(BaseHTTPRequestHandler):
+    """
+    Runs on a server worker thread per connection. Everything it touches on
+    the module is read-only after init, actions are handed to the main
+    thread queue.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # Socket timeout, also bounds how long an idle keep-alive connection lives
+        self.timeout = self.server.module.idle_timeout
+        super(HTTPInputHandler, self).setup()
+
+    def do_GET(self):
+        self.server.module.handle_request(self)
+
+    def do_POST(self):
+        self.server.module.handle_request(self)
+
+    def respond(self, code, headers=None):
+        self.send_response(code)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logging.debug(f'HTTPServer {self.address_string()} {format % args}')
+
+
 class HTTPServerThread(HTTPThread):
 
+    display_name: str = 'HTTPIn'
     module_io_type: ModuleIOType = ModuleIOType.Input
 
-    # Copy from GPIThread
-    pass
+    # Keep-alive connections idle longer than this are closed
+    idle_timeout: float = 5 # sec
+
+    # Larger bodies are refused, webhooks carry little data
+    max_body_size: int = 65536
+
+    whitelist: IPWhitelist = None
+
+    # Clients rejected by the whitelist, reported at most once per interval
+    rejected: int = 0
+    rejected_logged: int = 0
+    rejected_logged_at: float = float('-inf')
+    reject_log_interval: float = 5 # sec
+
+    # Rejections are counted on the server worker threads
+    reject_lock: threading.Lock = None
+
+    # Request path -> HTTPInputRoute, compiled once at init
+    route_matcher: PayloadMatcher = None
+
+    server: HTTPInputServer = None
+    serve_thread: threading.Thread = None
+
+    def init(self):
+        super(HTTPServerThread, self).init()
+
+        self.whitelist = IPWhitelist(self.module_id, self.config.get('AllowedIP', []))
+        self.reject_lock = threading.Lock()
+        self.idle_timeout = float(self.config.get('IdleTimeout', self.idle_timeout))
+
+        self.init_routes()
+        self.listen()
+
+    def init_routes(self):
+        routes = {}
+
+        for route_cfg in self.config.get('Routes', []):
+            path = route_cfg.get('Path', None)
+            if path is None or len(path.strip()) == 0:
+                raise exceptions.FxConfigException('HTTP route "Path" must not be empty.', fatal=True)
+
+            path = path.strip()
+            match_type = route_cfg.get('Match', 'Exact')
+
+            methods = route_cfg.get('Method', list(self.allowed_methods))
+            if type(methods) is not list:
+                methods = [methods]
+
+            actions = route_cfg.get('Actions', [])
+            if type(actions) is not list:
+                raise exceptions.FxConfigException(f'HTTP route "{path}" "Actions" must be a list.', fatal=True)
+
+            route = routes.get((match_type, path), None)
+            if route is None:
+                route = routes[(match_type, path)] = HTTPInputRoute(path)
+
+            for method in methods:
+                method = method.upper()
+                if method not in self.allowed_methods:
+                    raise exceptions.FxConfigException(f'HTTP method "{method}" not supported.', fatal=True)
+
+                if method in route.actions:
+                    logging.warning(f'Duplicate HTTP route {method} {path}, only the first definition is used.')
+                    continue
+
+                route.actions[method] = tuple(actions)
+
+        self.route_matcher = PayloadMatcher()
+        for (match_type, path), route in routes.items():
+            self.route_matcher.add(path, route, match_type)
+
+        self.route_matcher.compile()
+        logging.debug(f'HTTPServer compiled {len(self.route_matcher)} route(s)')
+
+    def resolve_actions(self, actions):
+        unknown = []
+        for route in self.route_matcher.values():
+            for method, names in route.actions.items():
+                route.actions[method], missing = actions.resolve(names)
+                unknown += [f'"{name}" (route {method} {route.path})' for name in missing]
+
+        if len(unknown) > 0:
+            raise exceptions.FxConfigException(f'HTTP routes reference unknown action(s): {", ".join(unknown)}.')
+
+    def listen(self):
+        address = self.config.get('Listen', '0.0.0.0')
+        port = int(self.config.get('Port', 0))
+
+        logging.info(f'Listening for HTTP on http://{address}:{port}')
+
+        try:
+            self.server = HTTPInputServer((address, port), HTTPInputHandler)
+        except OSError as e:
+            raise exceptions.FxNetworkException(f'HTTPServer cannot listen on http://{address}:{port}', e, fatal=True)
+
+        self.server.module = self
+        self.initialized = True
+
+    def pre_start(self):
+        super(HTTPServerThread, self).pre_start()
+
+        self.serve_thread = threading.Thread(target=self.server.serve_forever, name=f'{self.module_id}Server', daemon=True)
+        self.serve_thread.start()
+
+    def handle_request(self, request):
+        """
+        Called on the server worker thread owning the connection.
+
+        """
+        if not self.whitelist.allows(request.client_address[0]):
+            request.close_connection = True
+            request.respond(403)
+            self.reject_client(request.client_address)
+            return
+
+        if not self.discard_body(request):
+            return
+
+        path = urlsplit(request.path).path
+        route = self.route_matcher.match(path)
+        if route is None:
+            self.parent.update_module_status_later(self, ModuleStatus.Activity | ModuleStatus.Warning)
+            request.respond(404)
+            return
+
+        actions = route.actions.get(request.command, None)
+        if actions is None:
+            request.respond(405, {'Allow': ', '.join(route.actions)})
+            return
+
+        for action in actions:
+            self.parent.run_action_later(action)
+
+        request.respond(202)
+
+        logging.info(f'HTTPServer received {request.command} {path}, running {len(actions)} action(s)...')
+        self.parent.update_module_status_later(self, ModuleStatus.Activity | ModuleStatus.Running)
+
+    def reject_client(self, addr):
+        # A flooding client must not flood the log and the UI as well
+        now = time.monotonic()
+        with self.reject_lock:
+            self.rejected += 1
+            if now - self.rejected_logged_at < self.reject_log_interval:
+                return
+
+            suppressed = self.rejected - self.rejected_logged - 1
+            self.rejected_logged = self.rejected
+            self.rejected_logged_at = now
+
+        self.parent.update_module_status_later(self, ModuleStatus.Activity | ModuleStatus.Warning)
+        logging.warning(f'Rejected HTTP request from {addr[0]}, not on whitelist!' + (f' ({suppressed} more since last report)' if suppressed > 0 else ''))
+
+    def discard_body(self, request):
+        # The body must be consumed for the next keep-alive request to parse
+        if 'chunked' in request.headers.get('Transfer-Encoding', '').lower():
+            request.close_connection = True
+            return True
+
+        try:
+            length = int(request.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+
+        if length < 0 or length > self.max_body_size:
+            request.close_connection = True
+            request.respond(413)
+            return False
+
+        if length > 0:
+            request.rfile.read(length)
+
+        return True
+
+    def cleanup(self):
+        if self.server is None:
+            return
+
+        if self.serve_thread is not None:
+            self.server.shutdown()
+
+        self.server.server_close()
 
 class HTTPClientThread(HTTPThread):
 
     display_name: str = 'HTTPOut'
     module_io_type: ModuleIOType = ModuleIOType.Output
 
+    # Methods that are safe to send again after a failed attempt
+    idempotent_methods = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'))
+
+    default_timeout: tuple = (3, 5) # sec, (connect, read)
+
+    # scheme://host:port -> requests.Session with keep-alive
+    sessions: dict = None
+
+    # Requests run on the pool, lane bookkeeping stays on this thread
+    executor: ThreadPoolExecutor = None
+    max_workers: int = 8
+    max_per_host: int = 4
+
+    # scheme://host:port -> HTTPHostLane
+    lanes: dict = None
+
+    # Set first thing on shutdown, pool workers skip requests from then on
+    stopping: bool = False
+
     def init(self):
         super(HTTPClientThread, self).init()
 
+        if requests is None:
+            raise exceptions.FxConfigException('HTTPClient requires the "requests" package listed in requirements.txt.', fatal=True)
+
+        self.default_timeout = (
+            float(self.config.get('ConnectTimeout', self.default_timeout[0])),
+            float(self.config.get('ReadTimeout', self.default_timeout[1])),
+        )
+
+        self.max_workers = max(1, int(self.config.get('MaxWorkers', self.max_workers)))
+        self.max_per_host = max(1, int(self.config.get('MaxConcurrencyPerHost', self.max_per_host)))
+
+        self.init_output_commands(self.config.get('OutputCommands', []), self.compile_output_command)
+        self.init_lanes()
+        self.init_sessions()
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.module_id)
         self.initialized = True
 
+    def compile_output_command(self, command):
+        return HTTPOutputCommand(command, self.default_timeout)
+
+    def init_lanes(self):
+        self.lanes = {}
+
+        # {"http://host:port": limit}, overrides MaxConcurrencyPerHost
+        for host, limit in self.config.get('HostConcurrency', {}).items():
+            host = host.strip().rstrip('/')
+            self.lanes[host] = HTTPHostLane(host, int(limit))
+
+        for command in self.output_commands.values():
+            self.get_lane(command.host)
+
+    def get_lane(self, host):
+        lane = self.lanes.get(host, None)
+        if lane is None:
+            lane = self.lanes[host] = HTTPHostLane(host, self.max_per_host)
+
+        return lane
+
+    def init_sessions(self):
+        self.sessions = {}
+        for command in self.output_commands.values():
+            if command.host not in self.sessions:
+                self.sessions[command.host] = self.create_session(self.get_lane(command.host).limit)
+
+    def create_retry(self):
+        # Connect errors are retried for every method, POST included, as the
+        # request never left. Read errors and retry statuses are only retried
+        # for the idempotent methods, a POST that may have arrived is not sent again.
+        options = {
+            'total': int(self.config.get('Retries', 2)),
+            'connect': None,
+            'read': None,
+            'backoff_factor': float(self.config.get('RetryBackoff', 0.1)),
+            'status_forcelist': (502, 503, 504),
+            'raise_on_status': False,
+        }
+
+        # urllib3 renamed method_whitelist in 1.26
+        try:
+            return Retry(allowed_methods=self.idempotent_methods, **options)
+        except TypeError:
+            return Retry(method_whitelist=self.idempotent_methods, **options)
+
+    def create_session(self, concurrency=1):
+        # Every concurrent request to the host needs its own pooled connection
+        pool_size = max(int(self.config.get('PoolSize', 4)), concurrency)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=self.create_retry())
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get_session(self, host):
+        session = self.sessions.get(host, None)
+        if session is None:
+            session = self.sessions[host] = self.create_session(self.get_lane(host).limit)
+
+        return session
+
     def show_manual_send_window(self):
-        commands = self.config.get('OutputCommands', [])
+        from ui.http import HTTPManualSendWindow
+
         data = {
-            'cmd_list': [ f"{self.module_id}: {cmd.get('Text', 'Unnamed')}" for cmd in commands ],
+            'cmd_list': list(self.output_command_labels),
             'callback_safe': self.run_later('manual_send_callback').with_args
         } 
 
         self.parent.UI.create_window_later(HTTPManualSendWindow, user_data=data)
 
-    def manual_send_callback(self, val):
-        commands = self.config.get('OutputCommands', [])
-        send_cmd = None
-        for command in commands:
-            if '{}: {}'.format(self.module_id, command['Text']) == val:
-                send_cmd = command
-                break
-    
-        if send_cmd is not None:
-            self.send(send_cmd)
-
-        # self.show_manual_send_window()
-
-    def run_output_command_handler(self, output_command):
-        # TODO: Make more efficient
-        commands = self.config.get('OutputCommands', [])
-        for command in commands:
-            if command.get('Name', '') == output_command:
-                self.send(command)
-                break
-
     def send(self, http_command):
-        method = http_command.get('Method', 'GET')
-        url = http_command.get('Url', None)
+        """
+        Queues the request on its host lane and returns a Future settled with
+        True or False once it has run, without waiting for it.
 
+        """
         self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
-            
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        lane = self.get_lane(http_command.host)
+        lane.waiting.append((http_command, future))
+        self.pump_lane(lane)
+
+        return future
+
+    def pump_lane(self, lane):
+        while len(lane.waiting) > 0 and lane.active < lane.limit and not lane.exclusive:
+            http_command, future = lane.waiting[0]
+            if http_command.ordered:
+                if lane.active > 0:
+                    break
+
+                lane.exclusive = True
+
+            lane.waiting.popleft()
+            self.start_request(lane, http_command, future)
+
+    def start_request(self, lane, http_command, future):
+        lane.active += 1
+        started = time.monotonic()
+
+        try:
+            work = self.executor.submit(self.execute, http_command)
+        except RuntimeError:
+            # Pool already shut down
+            self.request_done(lane, http_command, None, future, started)
+            return
+
+        lane.running[future] = work
+        work.add_done_callback(lambda done: self.request_finished(lane, http_command, done, future, started))
+
+    def request_finished(self, *args):
+        # Pool worker side, once stopping cleanup() settles whatever is left itself
+        if not self.stopping:
+            self.run_later(self.request_done).with_args(*args)
+
+    def request_done(self, lane, http_command, done, future, started):
+        lane.running.pop(future, None)
+        lane.active -= 1
+        if http_command.ordered:
+            lane.exclusive = False
+
+        if done is None or done.cancelled():
+            lane.stats.dropped += 1
+            future.set_result(False)
+        elif done.exception() is not None:
+            lane.stats.failed += 1
+            future.set_exception(done.exception())
+        else:
+            if done.result() is True:
+                lane.stats.record_sent(time.monotonic() - started)
+            else:
+                lane.stats.failed += 1
+            future.set_result(done.result())
+
+        self.pump_lane(lane)
+
+    def execute(self, http_command):
+        """
+        Runs on a pool worker, must not touch the lanes.
+
+        """
+        if self.stopping:
+            return False
+
         exc = None
         try:
-            if method == 'GET':
-                return self.sendGet(url)
-            elif method == 'POST':
-                payload = http_command.get('Payload', None)
-                return self.sendPost(url, payload)
+            return self.request(http_command)
 
         except requests.exceptions.HTTPError as e:
             exc = ('HTTP', e)
@@ -104,18 +574,57 @@ class HTTPClientThread(HTTPThread):
             exc = ('an', e)
 
         if exc is not None:
-            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
-            self.parent.run_later('UI.show_error').with_args(
+            self.parent.update_module_status_later(self, ModuleStatus.Activity | ModuleStatus.Error)
+            self.parent.UI.run_later('show_error').with_args(
                 f'HTTPClient returned with {exc[0]} error:',
                 f'Additional Information:\n{exc[1]}'
             )
 
         return False
 
-    def sendGet(self, url):
-        logging.info(f'HTTPClient sent GET request to {url}')
-        return requests.get(url).raise_for_status()
+    def request(self, http_command):
+        method = http_command.method
+        url = http_command.url
+        payload = http_command.payload
+
+        if payload is None:
+            logging.info(f'HTTPClient sent {method} request to {url}')
+        else:
+            logging.info(f'HTTPClient sent {method} request to {url}, data={payload}')
+
+        session = self.get_session(http_command.host)
+        response = session.request(method, url, data=payload, timeout=http_command.timeout)
+        response.raise_for_status()
+        return True
+
+    def target_stats(self):
+        # Called from other threads, lanes may grow meanwhile
+        return { host: lane.stats for host, lane in list(self.lanes.items()) }
+
+    def cleanup(self):
+        self.stopping = True
+        lanes = (self.lanes or {}).values()
+
+        if self.executor is not None:
+            # Requests still queued on the pool never start, only the running ones are waited for
+            for lane in lanes:
+                for work in lane.running.values():
+                    work.cancel()
+
+            self.executor.shutdown(wait=True)
+
+        for lane in lanes:
+            # This thread stops consuming, request_done() would never run for these
+            for future, work in lane.running.items():
+                if work.cancelled():
+                    future.set_result(False)
+                else:
+                    forward_outcome(work, future.set_result, future.set_exception)
+
+            lane.running.clear()
+
+            while len(lane.waiting) > 0:
+                lane.waiting.popleft()[1].set_result(False)
 
-    def sendPost(self, url, data, content_type=None):
-        logging.info(f'HTTPClient sent POST request to {url}, data={data}')
-        return requests.post(url, data=data).raise_for_status()
\ No newline at end of file
+        for session in (self.sessions or {}).values():
+            session.close()
\ No newline at end of file
@@ -1,17 +1,392 @@
 import logging
 
-from threads import SubThreadBase
+from threads import SelectorThreadBase
+from threads.transport import PersistentConnection
 
 import exceptions
+from helpers import lwrp
 from helpers.enum import ModuleStatus, ModuleIOType
 
-class LivewireThread(SubThreadBase):
+class LivewireNode():
+    """
+    One Axia node on a persistent LWRP session. Pin states are learned from
+    the subscribed change events, never polled.
+
+    """
+
+    name: str = None
+    connection: PersistentConnection = None
+
+    password: str = None
+    subscriptions: tuple = ()
+
+    framer: lwrp.LWRPFramer = None
+
+    # Port -> tuple of pin states as reported by the node, True is active (low)
+    gpi: dict = None
+    gpo: dict = None
+
+    # Port -> attributes of the last SRC event
+    sources: dict = None
+
+    def __init__(self, name, password, subscriptions):
+        self.name = name
+        self.password = password
+        self.subscriptions = subscriptions
+
+        self.framer = lwrp.LWRPFramer()
+        self.reset()
+
+    def __str__(self):
+        return f'<LivewireNode {self.name} {self.connection}>'
+
+    def reset(self):
+        self.framer.reset()
+        self.gpi = {}
+        self.gpo = {}
+        self.sources = {}
+
+    def pins(self, pin_type):
+        return self.gpi if pin_type == 'GPI' else self.gpo
+
+
+class LivewireInputCommand():
+
+    node: str = None
+    pin_type: str = 'GPI'
+    port: int = 0
+    pin: int = 0        # 0 based
+    state: str = 'Low'  # Low, High or Change
+    actions: tuple = ()
+
+    def __init__(self, node, pin_type, port, pin, state, actions):
+        self.node = node
+        self.pin_type = pin_type
+        self.port = port
+        self.pin = pin
+        self.state = state
+        self.actions = actions
+
+    def __str__(self):
+        return f'<LivewireInputCommand {self.node} {self.pin_type} {self.port}.{self.pin + 1} {self.state} actions={len(self.actions)}>'
+
+    def triggered_by(self, previous, current):
+        if self.pin >= len(previous) or self.pin >= len(current):
+            return False
+
+        was_active = previous[self.pin]
+        active = current[self.pin]
+        if was_active == active:
+            return False
+
+        if self.state == 'Change':
+            return True
+
+        return active is (self.state == 'Low')
+
+
+class LivewireOutputCommand():
+
+    name: str = None
+    node: LivewireNode = None
+    port: int = None
+
+    # h, l or x (keep the current state) per pin, None when payload is set
+    pattern: str = None
+    payload: bytes = None
+
+    def __init__(self, name, node, port=None, pattern=None, payload=None):
+        self.name = name
+        self.node = node
+        self.port = port
+        self.pattern = pattern
+        self.payload = payload
+
+    def __str__(self):
+        return f'<LivewireOutputCommand {self.name} node={self.node.name}>'
+
+    @property
+    def keeps_pins(self):
+        return self.pattern is not None and 'x' in self.pattern
+
+    def frame(self):
+        """
+        LWRP line to send, None while pins to keep have no known state,
+        i.e. before the node reported the port on the current session.
+
+        """
+        if self.payload is not None:
+            return self.payload
+
+        current = self.node.gpo.get(self.port, None)
+        if current is None and self.keeps_pins:
+            return None
+
+        pins = []
+        for i, char in enumerate(self.pattern):
+            if char == 'x':
+                pins.append(current[i] if i < len(current) else False)
+            else:
+                pins.append(char == 'l')
+
+        return lwrp.encode('GPO', self.port, lwrp.format_pins(pins))
+
+
+class LivewireThread(SelectorThreadBase):
 
     module_io_type: ModuleIOType = ModuleIOType.Bidirectional
 
+    config = {}
+
+    pin_types = ('GPI', 'GPO')
+    pin_states = ('Low', 'High', 'Change')
+    default_subscriptions = ('GPI', 'GPO', 'SRC')
+
+    # Node name -> LivewireNode
+    nodes: dict = None
+
+    # (node, pin type, port) -> list of LivewireInputCommand
+    input_commands: dict = None
+
     def init(self):
-        pass
+        self.config = self.parent.config['Modules'].get(self.module_id, {})
+
+        self.init_nodes()
+        self.init_input_commands()
+        self.init_output_commands(self.config.get('OutputCommands', []), self.compile_output_command)
+
+        # Usable while nodes are down, sends are buffered until they come back
+        self.initialized = True
+
+    def init_nodes(self):
+        self.nodes = {}
+
+        for node_cfg in self.config.get('Nodes', []):
+            name = node_cfg.get('Name', '').strip()
+            if len(name) <= 0:
+                raise exceptions.FxConfigException('Livewire node requires a "Name" property.', fatal=True)
+
+            if name in self.nodes:
+                raise exceptions.FxConfigException(f'Livewire node "{name}" is defined more than once.', fatal=True)
+
+            subscriptions = tuple(s.upper() for s in node_cfg.get('Subscribe', self.default_subscriptions))
+            node = LivewireNode(name, node_cfg.get('Password', ''), subscriptions)
+            node.connection = self.init_connection(node, node_cfg)
+
+            self.nodes[name] = node
+
+    def init_connection(self, node, node_cfg):
+        address = node_cfg.get('Hostname', '')
+        port = node_cfg.get('Port', lwrp.DEFAULT_PORT)
+
+        logging.info(f'Livewire node "{node.name}" at tcp://{address}:{port}')
+
+        return self.create_connection(
+            f'Livewire[{node.name}]', address, port, 'tcp', node_cfg,
+            on_state=lambda connection, error: self.connection_state_changed(node, error),
+            on_receive=lambda connection, data: self.receive(node, data),
+            # Cheap no-op keeping NAT and firewalls from dropping the session
+            probe_payload=lwrp.encode('VER') if self.connection_option(node_cfg, 'ProbeInterval') else None,
+        )
+
+    def get_node(self, name, context):
+        node = self.nodes.get(name, None)
+        if node is None:
+            raise exceptions.FxConfigException(f'Livewire {context} refers to unknown node "{name}".', fatal=True)
+
+        return node
+
+    def parse_pin(self, cfg, context):
+        try:
+            port = int(cfg.get('Port', 0))
+            pin = int(cfg.get('Pin', 0))
+        except (TypeError, ValueError) as e:
+            raise exceptions.FxConfigException(f'Livewire {context} "Port" and "Pin" must be numbers.', e, fatal=True)
+
+        if port <= 0 or not 1 <= pin <= lwrp.PIN_COUNT:
+            raise exceptions.FxConfigException(f'Livewire {context} needs a "Port" and a "Pin" between 1 and {lwrp.PIN_COUNT}.', fatal=True)
+
+        state = cfg.get('State', 'Low')
+        if state not in self.pin_states:
+            raise exceptions.FxConfigException(f'Livewire {context} "State" must be one of {", ".join(self.pin_states)}.', fatal=True)
+
+        return port, pin - 1, state
+
+    def init_input_commands(self):
+        self.input_commands = {}
+
+        for inp_cmd in self.config.get('InputCommands', []):
+            node = self.get_node(inp_cmd.get('Node', ''), 'input command')
+
+            pin_type = inp_cmd.get('Type', 'GPI').upper()
+            if pin_type not in self.pin_types:
+                raise exceptions.FxConfigException(f'Livewire input command type "{pin_type}" not supported.', fatal=True)
+
+            port, pin, state = self.parse_pin(inp_cmd, 'input command')
+
+            actions = inp_cmd.get('Actions', [])
+            if type(actions) is not list:
+                raise exceptions.FxConfigException('Livewire input command "Actions" must be a list.', fatal=True)
+
+            command = LivewireInputCommand(node.name, pin_type, port, pin, state, tuple(actions))
+            self.input_commands.setdefault((node.name, pin_type, port), []).append(command)
+
+        logging.debug(f'Livewire compiled {sum(len(c) for c in self.input_commands.values())} input command(s)')
+
+    def compile_output_command(self, command):
+        name = command.get('Name', '').strip()
+        context = f'output command "{name}"'
+        node = self.get_node(command.get('Node', ''), context)
+
+        payload = command.get('Payload', None)
+        if payload is not None:
+            # Raw LWRP line, e.g. "GPO 1 lhhhh"
+            return LivewireOutputCommand(name, node, payload=lwrp.encode(payload.strip()))
+
+        pattern = command.get('Pins', None)
+        if pattern is not None:
+            port = int(command.get('Port', 0))
+            pattern = pattern.lower()
+            if port <= 0 or len(pattern) != lwrp.PIN_COUNT or any(c not in 'hlx' for c in pattern):
+                raise exceptions.FxConfigException(f'Livewire {context} needs a "Port" and {lwrp.PIN_COUNT} "Pins" of h, l or x.', fatal=True)
+
+            return self.check_output_command(LivewireOutputCommand(name, node, port, pattern), context)
+
+        port, pin, state = self.parse_pin(command, context)
+        if state == 'Change':
+            raise exceptions.FxConfigException(f'Livewire {context} "State" must be Low or High.', fatal=True)
+
+        # Only touch the one pin, the others keep their reported state
+        pattern = ['x'] * lwrp.PIN_COUNT
+        pattern[pin] = 'l' if state == 'Low' else 'h'
+        return self.check_output_command(LivewireOutputCommand(name, node, port, ''.join(pattern)), context)
+
+    def check_output_command(self, command, context):
+        # Kept pins are only known from the GPO reports of the node
+        if command.keeps_pins and 'GPO' not in command.node.subscriptions:
+            raise exceptions.FxConfigException(f'Livewire {context} keeps pins unchanged, node "{command.node.name}" must subscribe to GPO.', fatal=True)
+
+        return command
+
+    def resolve_actions(self, actions):
+        unknown = []
+        for commands in self.input_commands.values():
+            for command in commands:
+                command.actions, missing = actions.resolve(command.actions)
+                unknown += [f'"{name}" ({command.node} {command.pin_type} {command.port}.{command.pin + 1})' for name in missing]
+
+        if len(unknown) > 0:
+            raise exceptions.FxConfigException(f'Livewire input commands reference unknown action(s): {", ".join(unknown)}.')
+
+    def pre_start(self):
+        for node in self.nodes.values():
+            node.connection.open()
+
+    def connection_state_changed(self, node, error):
+        if node.connection.connected:
+            self.start_session(node)
+        else:
+            # Reported states went stale with the session, kept pins are unknown again
+            node.reset()
+
+        self.report_connections(n.connection for n in self.nodes.values())
+
+    def start_session(self, node):
+        # States reported from here on seed the tables, nothing fires until they change
+        node.reset()
+
+        connection = node.connection
+        if len(node.password) > 0:
+            connection.send(lwrp.encode('LOGIN', node.password))
+        else:
+            connection.send(lwrp.encode('LOGIN'))
+
+        for subscription in node.subscriptions:
+            connection.send(lwrp.encode('ADD', subscription))
+
+        for pin_type in self.pin_types:
+            if pin_type in node.subscriptions:
+                connection.send(lwrp.encode(pin_type))
+
+    def receive(self, node, data):
+        for line in node.framer.feed(data):
+            message = lwrp.parse_line(line)
+            if message is None:
+                continue
+
+            if message.verb in self.pin_types:
+                self.process_pins(node, message)
+            elif message.verb == 'SRC' and message.port is not None:
+                node.sources[message.port] = message.attrs
+                logging.debug(f'Livewire node "{node.name}" source {message.port} changed: {message.attrs}')
+            elif message.verb == 'ERROR':
+                logging.warning(f'Livewire node "{node.name}" returned: {message.line}')
+            elif message.verb == 'VER':
+                logging.debug(f'Livewire node "{node.name}" version: {message.attrs}')
+
+    def process_pins(self, node, message):
+        if message.port is None or len(message.args) <= 0:
+            return
+
+        pins = lwrp.parse_pins(message.args[0])
+        if pins is None:
+            return
+
+        table = node.pins(message.verb)
+        previous = table.get(message.port, None)
+        table[message.port] = pins
+
+        if previous is None or previous == pins:
+            return
+
+        commands = self.input_commands.get((node.name, message.verb, message.port), None)
+        if commands is None:
+            return
+
+        for command in commands:
+            if not command.triggered_by(previous, pins):
+                continue
+
+            logging.info(f'Livewire node "{node.name}" {message.verb} {message.port} changed to {lwrp.format_pins(pins)}, running {len(command.actions)} action(s)...')
+
+            for action in command.actions:
+                self.parent.run_action_later(action)
+
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
+
+    def send(self, command):
+        if type(command) is not LivewireOutputCommand:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
+            return False
+
+        frame = command.frame()
+        if frame is None:
+            logging.error(f'Livewire node "{command.node.name}" has not reported GPO {command.port} yet, not sending {command.name}')
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
+            return False
+
+        result = command.node.connection.send(frame)
+
+        if result is False:
+            logging.error(f'{command.node.connection.name} cannot send data: {frame}')
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Error)
+            return False
+
+        logging.info(f'Livewire sent {frame} to node "{command.node.name}"')
+
+        if result is True:
+            self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Running)
+            return True
+
+        # Buffered until the node is back
+        self.parent.update_module_status(self, ModuleStatus.Activity | ModuleStatus.Warning)
+        return result
+
+    def target_stats(self):
+        return { name: node.connection.stats for name, node in self.nodes.items() }
 
     def cleanup(self):
-        pass
-    
\ No newline at end of file
+        for node in (self.nodes or {}).values():
+            node.connection.close()
+
+        super(LivewireThread, self).cleanup()
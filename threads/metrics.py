@@ -0,0 +1,166 @@
+import logging
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+import exceptions
+from helpers.enum import ModuleStatusMask
+from helpers.metrics import MetricsWriter
+from helpers.whitelist import IPWhitelist
+from threads.gpio import GPIThread
+
+class MetricsServer(HTTPServer):
+    allow_reuse_address = True
+
+    # Owning MetricsExporter
+    exporter = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves scrapes on the server thread, one at a time.
+
+    """
+
+    def do_GET(self):
+        exporter = self.server.exporter
+
+        if not exporter.whitelist.allows(self.client_address[0]):
+            logging.warning(f'Rejected metrics scrape from {self.client_address[0]}, not on whitelist!')
+            return self.respond(403)
+
+        if urlsplit(self.path).path not in ('/', '/metrics'):
+            return self.respond(404)
+
+        return self.respond(200, exporter.render().encode('utf-8'), MetricsWriter.content_type)
+
+    def respond(self, code, body=b'', content_type='text/plain'):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f'Metrics {self.address_string()} {format % args}')
+
+
+class MetricsExporter():
+    """
+    Optional Prometheus endpoint. Every scrape reads the counters the
+    threads already keep, nothing is collected between scrapes and the
+    threads never wait on it.
+
+    """
+
+    app = None
+    config: dict = None
+
+    server: MetricsServer = None
+    serve_thread: threading.Thread = None
+    whitelist: IPWhitelist = None
+
+    prefix: str = 'radiogpio'
+
+    def __init__(self, app, config):
+        self.app = app
+        self.config = config
+        self.whitelist = IPWhitelist('Metrics', self.config.get('AllowedIP', ['127.0.0.0/8']))
+
+        self.listen()
+
+    def listen(self):
+        address = self.config.get('Listen', '127.0.0.1')
+        port = int(self.config.get('Port', 9390))
+
+        logging.info(f'Serving metrics on http://{address}:{port}/metrics')
+
+        try:
+            self.server = MetricsServer((address, port), MetricsHandler)
+        except OSError as e:
+            raise exceptions.FxNetworkException(f'Metrics cannot listen on http://{address}:{port}', e)
+
+        self.server.exporter = self
+
+    def start(self):
+        self.serve_thread = threading.Thread(target=self.server.serve_forever, name='MetricsServer', daemon=True)
+        self.serve_thread.start()
+
+    def shutdown(self):
+        if self.serve_thread is not None:
+            self.server.shutdown()
+
+        self.server.server_close()
+
+    def render(self):
+        writer = MetricsWriter(self.prefix)
+
+        self.write_app(writer)
+        self.write_queues(writer)
+        self.write_gpi(writer)
+        self.write_targets(writer)
+        self.write_latency(writer)
+
+        return str(writer)
+
+    def write_app(self, writer):
+        writer.metric('info', 'gauge', 'Application version.', [({ 'version': self.app.version }, 1)])
+
+        writer.metric('module_status', 'gauge', 'ModuleStatus of each module without the activity flags.', [
+            ({ 'module': module_id }, int(status) & ModuleStatusMask.StatusMask)
+            for module_id, (status, _) in list(self.app.module_status.entries.items())
+        ])
+
+        if (ticks := self.app.UI.tick_durations) is not None:
+            writer.histogram('ui_tick_seconds', 'Length of each UI main loop iteration.', [(None, ticks)])
+
+    def write_queues(self, writer):
+        routes = [ ({ 'thread': thread.name }, thread, stats) for thread, stats in list(self.app.dispatcher.routes.items()) ]
+
+        writer.metric('queue_depth', 'gauge', 'Items waiting in the thread queue.', [ (labels, thread.queue.qsize()) for labels, thread, _ in routes ])
+        writer.metric('queue_queued_total', 'counter', 'Items queued on the thread.', [ (labels, int(stats.queued)) for labels, _, stats in routes ])
+        writer.metric('queue_processed_total', 'counter', 'Items the thread took off its queue.', [ (labels, int(stats.delivered)) for labels, _, stats in routes ])
+        writer.metric('queue_dropped_total', 'counter', 'Items dropped because the thread was not accepting work.', [ (labels, int(stats.dropped)) for labels, _, stats in routes ])
+        writer.histogram('queue_item_seconds', 'Time the thread spent running each queue item.', [ (labels, stats.busy) for labels, _, stats in routes ])
+
+    def write_gpi(self, writer):
+        modules = [ ({ 'module': module.module_id }, module) for module in self.app.subthread.values() if isinstance(module, GPIThread) ]
+
+        writer.metric('gpi_commands_received_total', 'counter', 'GPI commands received.', [ (labels, module.commands_received) for labels, module in modules ])
+        writer.metric('gpi_commands_matched_total', 'counter', 'GPI commands matching an input command.', [ (labels, module.commands_matched) for labels, module in modules ])
+        writer.metric('gpi_commands_unmatched_total', 'counter', 'GPI commands matching no input command.', [ (labels, module.commands_unmatched) for labels, module in modules ])
+        writer.metric('gpi_rejected_total', 'counter', 'GPI senders rejected by the whitelist.', [ (labels, module.rejected) for labels, module in modules ])
+        writer.metric('gpi_suppressed_total', 'counter', 'Matched GPI commands dropped by rate limiting or debouncing.', [
+            ({ **labels, 'reason': reason }, getattr(module.suppressed, reason))
+            for labels, module in modules for reason in module.suppressed.__slots__
+        ])
+
+    def write_targets(self, writer):
+        targets = [
+            ({ 'module': module.module_id, 'target': name }, stats)
+            for module in self.app.subthread.values() for name, stats in module.target_stats().items()
+        ]
+
+        writer.metric('target_sent_total', 'counter', 'Sends completed per output target.', [ (labels, stats.sent) for labels, stats in targets ])
+        writer.metric('target_failed_total', 'counter', 'Sends failed per output target.', [ (labels, stats.failed) for labels, stats in targets ])
+        writer.metric('target_dropped_total', 'counter', 'Buffered sends discarded per output target.', [ (labels, stats.dropped) for labels, stats in targets ])
+        writer.metric('target_connects_total', 'counter', 'Connections established per output target.', [ (labels, stats.connects) for labels, stats in targets ])
+
+        name = writer.family('target_send_seconds', 'summary', 'Send latency per output target.')
+        for labels, stats in targets:
+            writer.sample(f'{name}_sum', float(stats.latency_total), labels)
+            writer.sample(f'{name}_count', stats.sent, labels)
+
+        writer.metric('target_send_max_seconds', 'gauge', 'Slowest send per output target.', [ (labels, float(stats.latency_max)) for labels, stats in targets ])
+
+    def write_latency(self, writer):
+        latency = self.app.latency
+        if latency is None or not latency.enabled:
+            return
+
+        snapshot = latency.snapshot()
+
+        writer.histogram('trigger_latency_seconds', 'GPI trigger to output sent, per action.', [ ({ 'action': name }, h) for name, h in snapshot['action'].items() ])
+        writer.histogram('trigger_module_latency_seconds', 'GPI trigger to output sent, per output module.', [ ({ 'module': name }, h) for name, h in snapshot['module'].items() ])
+        writer.histogram('trigger_stage_seconds', 'GPI trigger latency by stage.', [ ({ 'stage': name }, h) for name, h in snapshot['stage'].items() ])
+        writer.metric('trigger_failed_total', 'counter', 'Traced output commands that failed to send.', [(None, snapshot['failed'])])
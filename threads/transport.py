@@ -0,0 +1,382 @@
+import os
+import errno
+import random
+import socket
+import logging
+import selectors
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from helpers.enum import ConnectionState
+
+def enable_keepalive(sock, idle=10, interval=5, count=3):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # Not every platform exposes the tuning knobs
+    for option, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+class ConnectionStats():
+    """
+    Per-connection counters, written by the owner thread only.
+
+    """
+
+    __slots__ = ('sent', 'failed', 'dropped', 'connects', 'disconnects', 'latency_last', 'latency_max', 'latency_total')
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+
+    def __str__(self):
+        avg = self.latency_total / self.sent if self.sent > 0 else 0
+        return f'<ConnectionStats sent={self.sent} failed={self.failed} dropped={self.dropped} connects={self.connects} avg={avg * 1000:.3f}ms max={self.latency_max * 1000:.3f}ms>'
+
+    def record_sent(self, latency):
+        self.sent += 1
+        self.latency_last = latency
+        self.latency_total += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+
+
+class PersistentConnection():
+    """
+    Non-blocking client connection owned by a SelectorThreadBase. It
+    connects in the background, reconnects with jittered exponential
+    backoff when the peer goes away, and buffers a bounded number of sends
+    while it is down. All methods must be called from the owner thread.
+
+    """
+
+    name: str = None
+    thread = None
+
+    protocol: str = 'tcp'
+    hostname: str = None
+    port: int = 0
+
+    family: int = socket.AF_INET
+    sock_type: int = socket.SOCK_STREAM
+    sockaddr: tuple = None
+
+    state: ConnectionState = ConnectionState.Disconnected
+    sock: socket.socket = None
+    closed: bool = False
+
+    stats: ConnectionStats = None
+
+    # Bytes accepted for sending but not yet taken by the kernel
+    outgoing: bytearray = None
+
+    # (frame, future, queued_at) held while disconnected
+    pending: deque = None
+
+    connect_timeout: float = 2      # sec
+    backoff_min: float = 0.5        # sec
+    backoff_max: float = 30         # sec
+    attempts: int = 0
+
+    buffer_size: int = 64
+    buffer_timeout: float = 10      # sec, older buffered sends are discarded
+
+    probe_interval: float = 0       # sec, 0 disables probing
+    probe_payload: bytes = None
+
+    timer = None
+    probe_timer = None
+
+    # Callbacks, on_state(connection, error) and on_receive(connection, data)
+    on_state = None
+    on_receive = None
+
+    def __init__(self, thread, name, hostname, port, protocol='tcp', on_state=None, on_receive=None, **options):
+        self.thread = thread
+        self.name = name
+        self.hostname = hostname
+        self.port = port
+        self.protocol = protocol
+        self.on_state = on_state
+        self.on_receive = on_receive
+
+        self.outgoing = bytearray()
+        self.pending = deque()
+        self.stats = ConnectionStats()
+
+        for option, value in options.items():
+            if value is not None and hasattr(self, option):
+                setattr(self, option, value)
+
+        if protocol == 'tcp':
+            self.sock_type = socket.SOCK_STREAM
+        elif protocol == 'udp':
+            self.sock_type = socket.SOCK_DGRAM
+        else:
+            raise ValueError(f'Protocol "{protocol}" not supported.')
+
+        # Resolved once, reconnects must not block on DNS; raises socket.gaierror
+        info = socket.getaddrinfo(hostname, port, type=self.sock_type)[0]
+        self.family = info[0]
+        self.sockaddr = info[4]
+
+    def __str__(self):
+        return f'{self.protocol}://{self.hostname}:{self.port}'
+
+    @property
+    def connected(self):
+        return self.state is ConnectionState.Connected
+
+    def open(self):
+        if self.closed or self.state is not ConnectionState.Disconnected:
+            return
+
+        self.cancel_timer()
+        self.state = ConnectionState.Connecting
+
+        try:
+            sock = socket.socket(self.family, self.sock_type)
+            sock.setblocking(False)
+            if self.sock_type == socket.SOCK_STREAM:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                enable_keepalive(sock)
+
+            err = sock.connect_ex(self.sockaddr)
+        except OSError as e:
+            self.fail(e)
+            return
+
+        self.sock = sock
+
+        if err == 0 and self.sock_type == socket.SOCK_DGRAM:
+            self.established()
+        elif err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            self.watch(selectors.EVENT_WRITE, self.on_connect)
+            self.timer = self.thread.scheduler.call_later(self.connect_timeout, self.on_connect_timeout)
+        else:
+            self.fail(OSError(err, os.strerror(err)))
+
+    def on_connect(self, sock):
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err != 0:
+            self.fail(OSError(err, os.strerror(err)))
+            return
+
+        self.established()
+
+    def on_connect_timeout(self):
+        self.timer = None
+        self.fail(socket.timeout(f'connect timed out after {self.connect_timeout} sec'))
+
+    def established(self):
+        self.cancel_timer()
+        self.state = ConnectionState.Connected
+        self.attempts = 0
+        self.stats.connects += 1
+
+        logging.info(f'{self.name} connected to {self}')
+        self.watch(selectors.EVENT_READ, self.on_ready)
+        self.notify_state()
+
+        self.flush_pending()
+        self.arm_probe()
+
+    def on_ready(self, sock):
+        if len(self.outgoing) > 0:
+            self.flush_outgoing()
+
+        if self.state is not ConnectionState.Connected:
+            return
+
+        try:
+            data = sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.fail(e)
+            return
+
+        if not data and self.sock_type == socket.SOCK_STREAM:
+            self.fail(ConnectionResetError('connection closed by peer'))
+            return
+
+        if self.on_receive is not None:
+            self.on_receive(self, data)
+
+    def send(self, frame):
+        """
+        Returns True once the frame is handed over in order, a Future settled
+        when a buffered frame is finally sent (or discarded), or False when
+        buffering is disabled.
+
+        """
+        started = time.monotonic()
+        if self.state is ConnectionState.Connected and self.write(frame):
+            self.stats.record_sent(time.monotonic() - started)
+            return True
+
+        return self.buffer(frame)
+
+    def write(self, frame):
+        if len(self.outgoing) <= 0:
+            try:
+                sent = self.sock.send(frame)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError as e:
+                self.fail(e)
+                return False
+
+            if sent >= len(frame):
+                return True
+
+            frame = frame[sent:]
+
+        # Keep ordering behind the unsent bytes, the selector flushes them
+        self.outgoing += frame
+        self.watch(selectors.EVENT_READ | selectors.EVENT_WRITE, self.on_ready)
+        return True
+
+    def flush_outgoing(self):
+        try:
+            sent = self.sock.send(self.outgoing)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.fail(e)
+            return
+
+        del self.outgoing[:sent]
+        if len(self.outgoing) <= 0:
+            self.watch(selectors.EVENT_READ, self.on_ready)
+
+    def buffer(self, frame):
+        if self.buffer_size <= 0 or self.closed:
+            self.stats.failed += 1
+            return False
+
+        if len(self.pending) >= self.buffer_size:
+            _, dropped, _ = self.pending.popleft()
+            dropped.set_result(False)
+            self.stats.dropped += 1
+            logging.warning(f'{self.name} send buffer for {self} full, dropped the oldest frame')
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.pending.append((frame, future, time.monotonic()))
+
+        logging.warning(f'{self.name} not connected to {self}, buffered frame ({len(self.pending)}/{self.buffer_size})')
+        return future
+
+    def flush_pending(self):
+        now = time.monotonic()
+        while len(self.pending) > 0 and self.state is ConnectionState.Connected:
+            frame, future, queued_at = self.pending.popleft()
+
+            if now - queued_at > self.buffer_timeout:
+                logging.warning(f'{self.name} discarded a frame buffered {now - queued_at:.1f} sec ago for {self}')
+                future.set_result(False)
+                self.stats.dropped += 1
+                continue
+
+            if not self.write(frame):
+                # Lost the connection again, keep the frame at the front
+                self.pending.appendleft((frame, future, queued_at))
+                break
+
+            self.stats.record_sent(time.monotonic() - queued_at)
+            future.set_result(True)
+
+    def arm_probe(self):
+        if self.probe_interval > 0 and self.probe_timer is None:
+            self.probe_timer = self.thread.scheduler.call_later(self.probe_interval, self.probe)
+
+    def probe(self):
+        self.probe_timer = None
+        if self.state is not ConnectionState.Connected:
+            return
+
+        if self.probe_payload is not None:
+            if not self.write(self.probe_payload):
+                return
+        else:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err != 0:
+                self.fail(OSError(err, os.strerror(err)))
+                return
+
+        self.arm_probe()
+
+    def fail(self, error):
+        was_connected = self.state is ConnectionState.Connected
+        self.close_socket()
+        self.state = ConnectionState.Disconnected
+
+        if len(self.outgoing) > 0:
+            logging.warning(f'{self.name} lost {len(self.outgoing)} unsent byte(s) to {self}')
+            self.outgoing.clear()
+
+        if was_connected:
+            self.stats.disconnects += 1
+            logging.error(f'{self.name} connection to {self} lost: {error}')
+        else:
+            logging.error(f'{self.name} cannot connect to {self}: {error}')
+
+        self.notify_state(error)
+        self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        if self.closed:
+            return
+
+        # Full jitter keeps many clients from reconnecting in lockstep
+        delay = min(self.backoff_max, self.backoff_min * (2 ** self.attempts))
+        delay *= random.uniform(0.5, 1)
+        self.attempts += 1
+
+        logging.info(f'{self.name} reconnecting to {self} in {delay:.2f} sec (attempt {self.attempts})')
+        self.timer = self.thread.scheduler.call_later(delay, self.open)
+
+    def notify_state(self, error=None):
+        if self.on_state is not None:
+            self.on_state(self, error)
+
+    def watch(self, events, handler):
+        try:
+            self.thread.selector.modify(self.sock, events, handler)
+        except KeyError:
+            self.thread.selector.register(self.sock, events, handler)
+
+    def cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def close_socket(self):
+        if self.probe_timer is not None:
+            self.probe_timer.cancel()
+            self.probe_timer = None
+
+        self.cancel_timer()
+
+        if self.sock is not None:
+            self.thread.unregister(self.sock)
+            self.sock.close()
+            self.sock = None
+
+    def close(self):
+        self.closed = True
+        self.close_socket()
+        self.state = ConnectionState.Disconnected
+
+        while len(self.pending) > 0:
+            self.pending.popleft()[1].set_result(False)
+            self.stats.dropped += 1
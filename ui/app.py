@@ -15,8 +15,32 @@ class MainWindow(WindowBase):
 
     actionbtn_active = []
 
+    # Status flags -> (activity flash style, settled style), (text, background) colors
+    status_styles: dict = None
+
+    # module_id -> status Text element, the style it shows and the last sequence rendered
+    status_elements: dict = None
+    status_shown: dict = None
+    status_seen: dict = None
+    status_version: int = None
+
+    # module_id -> style to show once the current activity flash is over
+    status_settling: dict = None
+
+    # Base status -> rank, the worst status set between two renders is flashed
+    status_severity = {
+        ModuleStatus.Warning: 1,
+        ModuleStatus.Error: 2,
+    }
+
     def __init__(self, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
+
+        self.status_elements = {}
+        self.status_shown = {}
+        self.status_seen = {}
+        self.status_settling = {}
+
         self.init_event_map()
         self.init_components()
 
@@ -33,6 +57,7 @@ class MainWindow(WindowBase):
         self.SetIcon(icon=APP_ICON_ICO_BASE64)
 
         self.theme_table = sg.LOOK_AND_FEEL_TABLE[self.ui.config.get('Theme', self.ui.default_theme)]
+        self.init_status_styles()
         self.init_layout()
 
         self.Finalize()
@@ -65,10 +90,12 @@ class MainWindow(WindowBase):
                     text = row.text
                     action = row.name
                 else:
-                    # TODO: Verify action exists!
                     text = row.get('Text', None)
                     action = row.get('Action', None)
 
+                    if action is not None and action not in self.ui.app.actions:
+                        logging.warning(f'Button "{text}" refers to unknown action "{action}".')
+
                 if text is None:
                     text = action
 
@@ -81,7 +108,7 @@ class MainWindow(WindowBase):
                 buttons.append([
                     sg.Button(
                         text,
-                        key=f'action_btn.{action}',
+                        key=Action.button_key(action),
                         size=(width, height), 
                         font=global_font,
                         button_color=btn_color,
@@ -104,7 +131,9 @@ class MainWindow(WindowBase):
             module_id = module.module_id
 
             # Status display
-            modules_row.append(sg.Text(text=module_text, key=f'status_{module_id}', font=('Consolas', 10), text_color='grey'))
+            status_element = sg.Text(text=module_text, key=f'status_{module_id}', font=('Consolas', 10), text_color='grey')
+            self.status_elements[module_id] = status_element
+            modules_row.append(status_element)
 
             # Menubar
             modules_menu.append(module_text)
@@ -154,58 +183,97 @@ class MainWindow(WindowBase):
         
         return result
 
+    def init_status_styles(self):
+        background = self.get_theme_color('BACKGROUND')
+        running = ('green', background)
+
+        settled = {
+            ModuleStatus.Initialized: ('white', 'grey'),
+            ModuleStatus.Running: running,
+            ModuleStatus.Warning: ('orange', background),
+            ModuleStatus.Error: ('red', background),
+        }
+
+        flashes = {
+            ModuleStatus.Running: ('white', 'green'),
+            ModuleStatus.Warning: ('white', 'orange'),
+            ModuleStatus.Error: ('white', 'red'),
+        }
+
+        # Every flag combination -> (flash style or None, settled style or None)
+        self.status_styles = {}
+        for status in range((ModuleStatusMask.StatusMask | ModuleStatusMask.ActivityMask | ModuleStatusMask.KeepActivityMask) + 1):
+            base = ModuleStatus(status & ModuleStatusMask.StatusMask)
+            flash = flashes.get(base, None) if status & ModuleStatusMask.ActivityMask else None
+
+            if flash is not None and not status & ModuleStatusMask.KeepActivityMask:
+                # A passing warning or error falls back to running once shown
+                self.status_styles[status] = (flash, running)
+            else:
+                self.status_styles[status] = (flash, settled.get(base, None))
+
     def update_module_status(self):
-        for module_id in self.ui.app.module_status:
-            status = self.ui.app.module_status[module_id]
-
-            if status == ModuleStatus.Running | ModuleStatus.Activity:
-                self[f'status_{module_id}'].Update(text_color='white', background_color='green')
-                self.ui.app.module_status[module_id] = ModuleStatus.Running
-                continue
-
-            if status == ModuleStatus.Error | ModuleStatus.Activity:
-                self[f'status_{module_id}'].Update(text_color='white', background_color='red')
-                if status & ModuleStatusMask.KeepActivityMask == ModuleStatus.KeepActivity:
-                    self.ui.app.module_status[module_id] = ModuleStatus.Error
-                else:
-                    self.ui.app.module_status[module_id] = ModuleStatus.Running
+        store = self.ui.app.module_status
+
+        # Activity flashes shown last time settle unless their module changed again
+        settling = self.status_settling
+        self.status_settling = {}
 
-                continue
+        if store.version != self.status_version:
+            self.status_version = store.version
 
-            if status == ModuleStatus.Warning | ModuleStatus.Activity:
-                self[f'status_{module_id}'].Update(text_color='white', background_color='orange')
-                if status & ModuleStatusMask.KeepActivityMask == ModuleStatus.KeepActivity:
-                    self.ui.app.module_status[module_id] = ModuleStatus.Warning
+            for module_id, status, sequence in store.changed_since(self.status_seen):
+                previous = self.status_seen.get(module_id, 0)
+                self.status_seen[module_id] = sequence
+                settling.pop(module_id, None)
+
+                flash, settled = self.status_styles.get(int(status), (None, None))
+
+                # An error overwritten before this render still gets its flash
+                transient = self.transient_status(store, module_id, previous, status)
+                if transient is not None:
+                    flash = self.status_styles[int(transient)][0] or flash
+                if flash is not None:
+                    self.show_module_status(module_id, flash)
+                    self.status_settling[module_id] = settled
                 else:
-                    self.ui.app.module_status[module_id] = ModuleStatus.Running
-
-                continue
-            
-            if status & ModuleStatusMask.StatusMask == ModuleStatus.Running:
-                self[f'status_{module_id}'].Update(text_color='green', background_color=self.get_theme_color('BACKGROUND'))
-                continue
-
-            if status & ModuleStatusMask.StatusMask == ModuleStatus.Error:
-                self[f'status_{module_id}'].Update(text_color='red', background_color=self.get_theme_color('BACKGROUND'))
-                continue
-
-            if status & ModuleStatusMask.StatusMask == ModuleStatus.Warning:
-                self[f'status_{module_id}'].Update(text_color='orange', background_color=self.get_theme_color('BACKGROUND'))
-                continue
-                
-            if status & ModuleStatusMask.StatusMask == ModuleStatus.Initialized:
-                self[f'status_{module_id}'].Update(text_color='white', background_color='grey')
-                continue
+                    self.show_module_status(module_id, settled)
+
+        for module_id, style in settling.items():
+            self.show_module_status(module_id, style)
+
+    def transient_status(self, store, module_id, previous, status):
+        worst = None
+        severity = self.status_severity.get(status & ModuleStatusMask.StatusMask, 0)
+
+        for _, event_status, _ in store.events_since(module_id, previous):
+            event_severity = self.status_severity.get(event_status & ModuleStatusMask.StatusMask, 0)
+            if event_severity > severity:
+                worst = event_status | ModuleStatus.Activity
+                severity = event_severity
+
+        return worst
+
+    def show_module_status(self, module_id, style):
+        if style is None or self.status_shown.get(module_id, None) == style:
+            return
+
+        element = self.status_elements.get(module_id, None)
+        if element is None:
+            return
+
+        element.Update(text_color=style[0], background_color=style[1])
+        self.status_shown[module_id] = style
 
     def init_event_map(self):
         self.event_map = [
             ('action_btn',              self.action_btn_click),
 
-            ('QUIT',                    self.ui.app.shutdown),
+            ('QUIT',                    lambda: self.ui.app.run_later('shutdown').run()),
             ('Minimize to taskbar',     self.ui.close_main_window),
 
-            ('GPO',                     self.ui.app.subthread.gpo.run_later('show_manual_send_window').run),
-            ('HTTP',                    self.ui.app.subthread.httpclient.run_later('show_manual_send_window').run),
+            ('GPO',                     lambda: self.ui.app.subthread.gpo.run_later('show_manual_send_window').run()),
+            ('HTTP',                    lambda: self.ui.app.subthread.httpclient.run_later('show_manual_send_window').run()),
 
             ('set_theme',               self.set_theme),
         ]
@@ -214,14 +282,18 @@ class MainWindow(WindowBase):
         self.ui.app.config['Interface']['Theme'] = theme
         self.ui.app.save_config_file()
         self.ui.app.restart = True
-        self.ui.app.shutdown()
+        self.ui.app.run_later('shutdown').run()
 
     def handle_event(self, event, values):
-        if self.ui.app.tps is not None:
-            self['tps'].update(f'TPS: {self.ui.app.tps:.2f}')
+        if self.ui.tps is not None:
+            self['tps'].update(f'TPS: {self.ui.tps:.2f}')
 
         args = []
 
+        # Action buttons are keyed by full action name, which may contain dots
+        if (action := self.ui.app.actions.get_by_key(event)) is not None:
+            return self.ui.app.run_action_later(action)
+
         if '::' in event:
             event = event.split('::')[1]
 
@@ -234,9 +306,8 @@ class MainWindow(WindowBase):
             if emap[0] == event:
                 return emap[1](*args)
 
-        for action in self.ui.app.actions:
-            if event == action.text:
-                return action.run()
+        if (action := self.ui.app.actions.get_by_text(event)) is not None:
+            return self.ui.app.run_action_later(action)
 
         for key, active_btn in enumerate(self.actionbtn_active):
             if active_btn[0] > 0:
@@ -246,10 +317,10 @@ class MainWindow(WindowBase):
                 self.actionbtn_active.remove(active_btn)
 
     def action_btn_click(self, action):
-        self.ui.app.run_action(action)
+        self.ui.app.run_action_later(action)
 
     def action_ran(self, action):
-        btnkey = f'action_btn.{action.name}'
+        btnkey = action.key
         self[btnkey].Update(button_color=('red', 'yellow'))
         self.actionbtn_active.append((2, btnkey))
 
@@ -0,0 +1,140 @@
+import json
+import logging
+import socket
+import time
+
+import exceptions
+from helpers import multi_getattr
+
+class LogSink():
+    """
+    Writes UI notifications to the log.
+
+    """
+
+    levels = {
+        'error': logging.ERROR,
+        'alert': logging.WARNING,
+        'notify': logging.INFO,
+        # Already logged when the action runs
+        'action': logging.DEBUG,
+    }
+
+    def emit(self, kind, *lines):
+        text = ' '.join(str(line).replace('\n', ' ') for line in lines)
+        logging.log(self.levels.get(kind, logging.INFO), f'[{kind}] {text}')
+
+    def close(self):
+        pass
+
+
+class SocketSink():
+    """
+    Sends UI notifications as JSON datagrams to a local listener, either
+    a unix datagram socket path or host:port over UDP. Sends never block,
+    with nobody listening the notification is dropped.
+
+    """
+
+    sock: socket.socket = None
+    address = None
+
+    def __init__(self, address):
+        if address.startswith('/'):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.address = address
+        else:
+            host, _, port = address.rpartition(':')
+            try:
+                self.address = (host or '127.0.0.1', int(port))
+            except ValueError as e:
+                raise exceptions.FxConfigException(f'Headless sink address "{address}" must be a path or host:port.', e)
+
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        self.sock.setblocking(False)
+
+    def emit(self, kind, *lines):
+        event = json.dumps({
+            'time': time.time(),
+            'kind': kind,
+            'lines': [ str(line) for line in lines ],
+        })
+
+        try:
+            self.sock.sendto(event.encode('utf-8'), self.address)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class HeadlessUI():
+    """
+    Stands in for FxGpioUI when running as a service. Nothing here imports
+    PySimpleGUI, alerts and notifications go to the configured sink.
+
+    """
+
+    simple_init: bool = False
+    full_init: bool = False
+
+    app = None
+    config: dict = None
+
+    sink = None
+
+    # No UI loop to measure
+    tick_durations = None
+
+    def __init__(self, app):
+        self.app = app
+
+        # Usable for init errors before the config is loaded
+        self.sink = LogSink()
+        self.simple_init = True
+
+    def post_init(self):
+        self.config = self.app.config.get('Interface', {}).get('Headless', {})
+        self.full_init = True
+
+        sink = self.config.get('Sink', 'log')
+        if sink == 'socket':
+            self.sink = SocketSink(self.config.get('Address', '127.0.0.1:9399'))
+        elif sink != 'log':
+            raise exceptions.FxUIException(f'Headless sink "{sink}" not supported.')
+
+    def run_later(self, method):
+        # No UI thread, the sinks are cheap and thread safe so the app thread runs them
+        if type(method) is str:
+            method = multi_getattr(self, method)
+
+        return self.app.run_later(method)
+
+    def app_start(self):
+        logging.info(f'{self.app.appname} running headless')
+
+    def ui_tick(self):
+        pass
+
+    def show_alert(self, *args, **kwargs):
+        self.sink.emit('alert', *args)
+
+    def show_error(self, *args, **kwargs):
+        self.sink.emit('error', *args)
+
+    def notify(self, *args, **kwargs):
+        self.sink.emit('notify', *args)
+
+    def ui_action_ran(self, sender):
+        self.sink.emit('action', sender.name)
+
+    def create_window_later(self, win_class, *args, **kwargs):
+        logging.warning(f'{win_class.__name__} is not available in headless mode')
+
+    def shutdown(self):
+        pass
+
+    def post_shutdown(self):
+        self.sink.close()